@@ -16,10 +16,45 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from collections import OrderedDict, deque
+from sqlalchemy import bindparam, create_engine, event, text
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import argparse
+import functools
+import gc
+import gzip
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import warnings
+import zipfile
 import ssl
 
+# Dependencias opcionais do espelho local e do cache em disco (Parquet + DuckDB)
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    PARQUET_DISPONIVEL = True
+except ImportError:
+    PARQUET_DISPONIVEL = False
+
+try:
+    import duckdb_engine  # noqa: F401 - registra o dialeto duckdb:// no SQLAlchemy
+    ESPELHO_LOCAL_DISPONIVEL = PARQUET_DISPONIVEL
+except ImportError:
+    ESPELHO_LOCAL_DISPONIVEL = False
+
 # Configuracoes SSL
 try:
     _create_unverified_https_context = ssl._create_unverified_context
@@ -30,6 +65,15 @@ else:
 
 warnings.filterwarnings('ignore')
 
+# Copy-on-write (padrao a partir do pandas 3): as visoes rasas dos DataFrames
+# compartilhados entre sessoes nunca alteram o objeto em cache
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# Fora do `streamlit run` (ex.: `python BCADASTRO_V6.py sincronizar`) o script
+# executa apenas os comandos de linha de comando da secao 9.
+EXECUCAO_STREAMLIT = runtime.exists()
+
 # Configuracao da pagina
 st.set_page_config(
     page_title="GENESIS V6 - Analise de Grupos Economicos",
@@ -63,7 +107,8 @@ def check_password():
                     st.error("Senha incorreta")
         st.stop()
 
-check_password()
+if EXECUCAO_STREAMLIT:
+    check_password()
 
 # =============================================================================
 # 3. ESTILOS CSS
@@ -174,6 +219,66 @@ DATABASE = 'gessimples'
 # Tabela principal V6
 TABELA_PRINCIPAL = 'bcad_v6_output_final'
 
+# Agregados do dashboard (PARTE 9 de BCAD_V6_OUTPUT_FINAL.sql)
+TABELA_RESUMO_AGREGADO = 'bcad_v6_resumo_agregado'
+
+# Resumo por grupo: ranking, lista e top de grupos (PARTE 10)
+TABELA_GRUPO_RESUMO = 'bcad_v6_grupo_resumo'
+
+# Pool de recursos do Impala (mesmo do pipeline) e limite de consultas
+# simultaneas disparadas por uma carga de pagina (threads do executor)
+IMPALA_REQUEST_POOL = 'medium'
+MAX_CONSULTAS_PARALELAS = int(os.environ.get('GENESIS_CONSULTAS_PARALELAS', '4'))
+
+# Conexoes do engine Impala, compartilhadas por todas as sessoes do processo:
+# mantidas no pool e extras abertas sob demanda (exportacoes em streaming
+# seguram uma conexao durante toda a execucao)
+CONEXOES_POOL_IMPALA = int(os.environ.get('GENESIS_POOL_CONEXOES', '10'))
+CONEXOES_EXTRAS_IMPALA = int(os.environ.get('GENESIS_POOL_CONEXOES_EXTRAS', '10'))
+
+# Pre-carregamento na Analise de Grupo: grupos seguintes do ranking buscados
+# apos o grupo destacado e tamanho maximo da fila do worker de pre-carga
+PRECARGA_PROXIMOS_GRUPOS = 3
+LIMITE_PRECARGA_PENDENTES = 6
+
+# Backend das consultas do dashboard: 'impala' (padrao) ou 'local' (espelho
+# Parquet gerado por `python BCADASTRO_V6.py sincronizar`, consultado via DuckDB)
+BACKEND_DADOS = os.environ.get('GENESIS_BACKEND', 'impala')
+DIRETORIO_DADOS_LOCAIS = os.environ.get('GENESIS_DADOS_LOCAIS', 'dados_locais')
+DIRETORIO_SNAPSHOT = os.path.join(DIRETORIO_DADOS_LOCAIS, 'snapshot')
+TABELAS_SNAPSHOT = [TABELA_PRINCIPAL, TABELA_RESUMO_AGREGADO, TABELA_GRUPO_RESUMO]
+LINHAS_POR_ARQUIVO_SNAPSHOT = 500000
+VERSOES_SNAPSHOT_MANTIDAS = 2
+
+# Cache em disco dos resultados das consultas (sobrevive a reinicios do
+# Streamlit); 0 desativa
+DIRETORIO_CACHE_DISCO = os.path.join(DIRETORIO_DADOS_LOCAIS, 'cache')
+LIMITE_CACHE_DISCO_MB = int(os.environ.get('GENESIS_CACHE_DISCO_MB', '1024'))
+
+# Memoria maxima (MB) dos resultados de drill-down mantidos por processo
+LIMITE_CACHE_DRILLDOWN_MB = int(os.environ.get('GENESIS_CACHE_DRILLDOWN_MB', '256'))
+
+# Memoria maxima (MB) das figuras Plotly serializadas mantidas por processo
+LIMITE_CACHE_FIGURAS_MB = int(os.environ.get('GENESIS_CACHE_FIGURAS_MB', '64'))
+
+# Exportacao da tabela principal: linhas lidas do banco por lote (limita a
+# memoria) e arquivos temporarios gerados, apagados apos a validade
+LINHAS_POR_LOTE_EXPORTACAO = int(os.environ.get('GENESIS_LOTE_EXPORTACAO', '100000'))
+DIRETORIO_EXPORTACOES = os.path.join(tempfile.gettempdir(), 'genesis_exportacoes')
+VALIDADE_EXPORTACOES_HORAS = 24
+
+# Dossies dos grupos EXCLUSAO_COM_DEBITO (comando `dossies`): grupos por
+# consulta `IN (...)`, grupos por tarefa enviada ao pool, processos (um nucleo
+# fica livre) e diretorio dos ZIPs listados na pagina Administracao
+GRUPOS_POR_CONSULTA_DOSSIE = 1000
+GRUPOS_POR_TAREFA_DOSSIE = 50
+PROCESSOS_DOSSIES = max(1, (os.cpu_count() or 2) - 1)
+DIRETORIO_DOSSIES = os.path.join(DIRETORIO_DADOS_LOCAIS, 'dossies')
+
+# Intervalo (segundos) entre verificacoes da versao dos dados; os caches dos
+# loaders so sao invalidados quando a versao muda (nova execucao do pipeline)
+INTERVALO_VERIFICACAO_VERSAO = 60
+
 # Credenciais (carregadas de forma segura)
 IMPALA_USER = st.secrets["impala_credentials"]["user"]
 IMPALA_PASSWORD = st.secrets["impala_credentials"]["password"]
@@ -189,13 +294,66 @@ def get_impala_engine():
                 'password': IMPALA_PASSWORD,
                 'auth_mechanism': 'LDAP',
                 'use_ssl': True
-            }
+            },
+            pool_size=CONEXOES_POOL_IMPALA,
+            max_overflow=CONEXOES_EXTRAS_IMPALA
         )
+
+        @event.listens_for(engine, "connect")
+        def definir_request_pool(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            cursor.execute(f"SET REQUEST_POOL='{IMPALA_REQUEST_POOL}'")
+            cursor.close()
+
         return engine
     except Exception as e:
         st.error(f"Erro ao criar engine Impala: {e}")
         return None
 
+def versao_snapshot_local():
+    """Retorna a versao (dt_processamento) do snapshot local ativo, se houver."""
+    caminho = os.path.join(DIRETORIO_SNAPSHOT, 'ATUAL')
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho) as arquivo:
+        return arquivo.read().strip() or None
+
+@st.cache_resource
+def get_duckdb_engine(versao):
+    """Cria engine DuckDB em memoria sobre os arquivos Parquet do snapshot."""
+    diretorio = os.path.abspath(os.path.join(DIRETORIO_SNAPSHOT, versao))
+    engine = create_engine('duckdb:///:memory:')
+
+    @event.listens_for(engine, "connect")
+    def criar_views_snapshot(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {DATABASE}")
+        for tabela in TABELAS_SNAPSHOT:
+            arquivos = os.path.join(diretorio, tabela, '*.parquet')
+            cursor.execute(
+                f"CREATE VIEW {DATABASE}.{tabela} AS "
+                f"SELECT * FROM read_parquet('{arquivos}', union_by_name = true)"
+            )
+        cursor.close()
+
+    return engine
+
+def get_engine_dados():
+    """Retorna a engine do backend configurado (Impala ou snapshot local)."""
+    if BACKEND_DADOS != 'local':
+        return get_impala_engine()
+
+    if not ESPELHO_LOCAL_DISPONIVEL:
+        st.error("Backend local requer os pacotes duckdb, duckdb_engine e pyarrow.")
+        return None
+
+    versao = versao_snapshot_local()
+    if versao is None:
+        st.error("Snapshot local nao encontrado. Execute `python BCADASTRO_V6.py sincronizar`.")
+        return None
+
+    return get_duckdb_engine(versao)
+
 def testar_conexao(engine):
     """Testa se a conexao esta funcionando."""
     if engine is None:
@@ -209,269 +367,1408 @@ def testar_conexao(engine):
         st.sidebar.error(f"Erro na conexao: {str(e)[:100]}")
         return False
 
+# =============================================================================
+# 4.1 ESPELHO LOCAL (PARQUET)
+# =============================================================================
+
+def sincronizar_snapshot_local(engine):
+    """Copia as tabelas V6 do Impala para arquivos Parquet locais.
+
+    O snapshot e gravado em DIRETORIO_SNAPSHOT/<versao>/<tabela>/, onde a
+    versao e o MAX(dt_processamento) da tabela principal. Se a versao ja
+    existir localmente nada e copiado. Retorna a versao ativa.
+    """
+    versao_df = pd.read_sql(
+        f"SELECT MAX(dt_processamento) AS versao FROM {DATABASE}.{TABELA_PRINCIPAL}",
+        engine
+    )
+    versao = pd.Timestamp(versao_df['versao'].iloc[0]).strftime('%Y%m%dT%H%M%S')
+    destino = os.path.join(DIRETORIO_SNAPSHOT, versao)
+
+    if os.path.exists(os.path.join(destino, '_SUCESSO')):
+        print(f"Snapshot {versao} ja esta atualizado.")
+    else:
+        temporario = destino + '.tmp'
+        shutil.rmtree(temporario, ignore_errors=True)
+
+        for tabela in TABELAS_SNAPSHOT:
+            os.makedirs(os.path.join(temporario, tabela))
+            # Ordenado por grupo para que os filtros por num_grupo descartem
+            # row groups inteiros na leitura do Parquet
+            ordem = "ORDER BY num_grupo, cnpj_raiz" if tabela == TABELA_PRINCIPAL else ""
+            lotes = pd.read_sql(
+                f"SELECT * FROM {DATABASE}.{tabela} {ordem}",
+                engine,
+                chunksize=LINHAS_POR_ARQUIVO_SNAPSHOT
+            )
+            total = 0
+            for numero, lote in enumerate(lotes):
+                pq.write_table(
+                    pa.Table.from_pandas(lote, preserve_index=False),
+                    os.path.join(temporario, tabela, f"parte-{numero:05d}.parquet"),
+                    compression='zstd'
+                )
+                total += len(lote)
+            print(f"{tabela}: {total:,} linhas")
+
+        open(os.path.join(temporario, '_SUCESSO'), 'w').close()
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(temporario, destino)
+        print(f"Snapshot {versao} gravado em {destino}")
+
+    # Aponta o snapshot ativo (troca atomica) e remove versoes antigas
+    ponteiro = os.path.join(DIRETORIO_SNAPSHOT, 'ATUAL')
+    with open(ponteiro + '.tmp', 'w') as arquivo:
+        arquivo.write(versao)
+    os.replace(ponteiro + '.tmp', ponteiro)
+
+    versoes = sorted(
+        nome for nome in os.listdir(DIRETORIO_SNAPSHOT)
+        if os.path.exists(os.path.join(DIRETORIO_SNAPSHOT, nome, '_SUCESSO'))
+    )
+    for antiga in versoes[:-VERSOES_SNAPSHOT_MANTIDAS]:
+        shutil.rmtree(os.path.join(DIRETORIO_SNAPSHOT, antiga), ignore_errors=True)
+
+    return versao
+
 # =============================================================================
 # 5. FUNCOES DE CARREGAMENTO DE DADOS - V6
 # =============================================================================
 
-@st.cache_data(ttl=3600)
-def carregar_resumo_geral(_engine):
-    """Carrega estatisticas gerais da tabela V6."""
-    try:
-        query = f"""
-            SELECT
-                COUNT(DISTINCT num_grupo) as total_grupos,
-                COUNT(DISTINCT cnpj_raiz) as total_empresas,
-                COUNT(DISTINCT cpf) as total_socios,
-                SUM(CASE WHEN acao = 'EXCLUSAO_COM_DEBITO' THEN 1 ELSE 0 END) as exclusao_com_debito,
-                SUM(CASE WHEN acao = 'EXCLUSAO_SEM_DEBITO' THEN 1 ELSE 0 END) as exclusao_sem_debito,
-                SUM(CASE WHEN acao = 'SEM_INTERESSE' THEN 1 ELSE 0 END) as sem_interesse,
-                SUM(vl_ct) as credito_total,
-                AVG(vl_ct) as credito_medio,
-                MAX(vl_ct) as credito_maximo,
-                SUM(CASE WHEN emite_te_sc = 'S' THEN 1 ELSE 0 END) as emite_te_sc,
-                COUNT(DISTINCT CASE WHEN uf = 'SC' THEN cnpj_raiz END) as empresas_sc,
-                SUM(receita_pa_fato) as receita_total,
-                AVG(receita_pa_fato) as receita_media
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-        """
-        df = pd.read_sql(query, _engine)
-        return df.iloc[0].to_dict()
-    except Exception as e:
-        st.error(f"Erro ao carregar resumo: {e}")
-        return {}
+@st.cache_data(ttl=INTERVALO_VERIFICACAO_VERSAO, show_spinner=False)
+def obter_versao_dados(_engine):
+    """Consulta barata da versao dos dados: MAX(dt_processamento) do resumo por grupo.
 
-@st.cache_data(ttl=3600)
-def carregar_distribuicao_acao(_engine):
-    """Carrega distribuicao por acao."""
-    try:
-        query = f"""
-            SELECT
-                acao,
-                COUNT(DISTINCT num_grupo) as qtd_grupos,
-                COUNT(DISTINCT cnpj_raiz) as qtd_empresas,
-                SUM(vl_ct) as credito_total,
-                AVG(vl_ct) as credito_medio,
-                AVG(receita_pa_fato) as receita_media,
-                MAX(receita_pa_fato) as receita_maxima
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            GROUP BY acao
-            ORDER BY qtd_grupos DESC
-        """
-        return pd.read_sql(query, _engine)
-    except Exception as e:
-        st.error(f"Erro ao carregar distribuicao: {e}")
-        return pd.DataFrame()
+    O resumo por grupo e a ultima tabela gravada pelo pipeline (PARTE 10): a
+    versao so muda quando todas as tabelas do dashboard estao prontas. Durante
+    a recriacao a consulta falha ou a tabela esta vazia e a versao anterior e
+    mantida. Falhas sao propagadas (e nao ficam em cache); tabela vazia retorna None.
+    """
+    df = pd.read_sql(
+        f"SELECT MAX(dt_processamento) AS versao FROM {DATABASE}.{TABELA_GRUPO_RESUMO}",
+        _engine
+    )
+    versao = df['versao'].iloc[0]
+    return None if pd.isna(versao) else str(versao)
 
-@st.cache_data(ttl=3600)
-def carregar_distribuicao_periodo(_engine):
-    """Carrega distribuicao por periodo (FLAG_PERIODO)."""
-    try:
-        query = f"""
-            SELECT
-                flag_periodo,
-                COUNT(DISTINCT num_grupo) as qtd_grupos,
-                COUNT(DISTINCT cnpj_raiz) as qtd_empresas,
-                SUM(vl_ct) as credito_total,
-                AVG(vl_ct) as credito_medio
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            WHERE flag_periodo IS NOT NULL AND flag_periodo != ''
-            GROUP BY flag_periodo
-            ORDER BY qtd_grupos DESC
-        """
-        return pd.read_sql(query, _engine)
-    except Exception as e:
-        st.error(f"Erro ao carregar periodos: {e}")
-        return pd.DataFrame()
+@st.cache_resource
+def controle_versao_dados():
+    """Estado compartilhado entre sessoes: ultima versao vista e caches versionados."""
+    return {'versao': None, 'caches': {}, 'lock': threading.Lock()}
 
-@st.cache_data(ttl=3600)
-def carregar_distribuicao_uf(_engine):
-    """Carrega distribuicao por UF."""
-    try:
-        query = f"""
-            SELECT
-                uf,
-                COUNT(DISTINCT num_grupo) as qtd_grupos,
-                COUNT(DISTINCT cnpj_raiz) as qtd_empresas,
-                SUM(vl_ct) as credito_total,
-                AVG(vl_ct) as credito_medio,
-                SUM(CASE WHEN emite_te_sc = 'S' THEN 1 ELSE 0 END) as emite_te,
-                SUM(CASE WHEN acao = 'EXCLUSAO_COM_DEBITO' THEN 1 ELSE 0 END) as exclusao_debito
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            GROUP BY uf
-            ORDER BY qtd_empresas DESC
-        """
-        return pd.read_sql(query, _engine)
-    except Exception as e:
-        st.error(f"Erro ao carregar UF: {e}")
-        return pd.DataFrame()
+def versao_dados_atual(engine):
+    """Retorna a versao dos dados e descarta os caches de versoes anteriores.
 
-@st.cache_data(ttl=3600)
-def carregar_distribuicao_inciso(_engine):
-    """Carrega distribuicao por tipo de inciso (III ou IV)."""
+    Se a consulta da versao falhar (ou a tabela estiver vazia), mantem a
+    ultima versao conhecida: uma falha transitoria nao esvazia os caches.
+    """
+    controle = controle_versao_dados()
     try:
-        query = f"""
-            SELECT
-                tipo_inciso,
-                COUNT(DISTINCT num_grupo) as qtd_grupos,
-                COUNT(DISTINCT cnpj_raiz) as qtd_empresas,
-                COUNT(DISTINCT cpf) as qtd_socios,
-                SUM(vl_ct) as credito_total,
-                AVG(receita_pa_fato) as receita_media
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            WHERE tipo_inciso IS NOT NULL AND tipo_inciso != ''
-            GROUP BY tipo_inciso
-            ORDER BY qtd_grupos DESC
-        """
-        return pd.read_sql(query, _engine)
-    except Exception as e:
-        st.error(f"Erro ao carregar incisos: {e}")
-        return pd.DataFrame()
+        versao = obter_versao_dados(engine)
+    except Exception:
+        versao = None
+    if versao is None or versao == 'NaT':
+        return controle['versao']
+
+    with controle['lock']:
+        if controle['versao'] != versao:
+            if controle['versao'] is not None:
+                for funcao_cache in controle['caches'].values():
+                    funcao_cache.clear()
+            controle['versao'] = versao
+    return versao
+
+def visao_somente_leitura(resultado):
+    """Copia rasa dos DataFrames do resultado (os dados em si sao compartilhados)."""
+    if isinstance(resultado, pd.DataFrame):
+        return resultado.copy(deep=False)
+    if isinstance(resultado, dict):
+        return {chave: visao_somente_leitura(valor) for chave, valor in resultado.items()}
+    return resultado
+
+def cache_por_versao(compartilhado=False, mensagem_erro=None, resultado_erro=pd.DataFrame, **opcoes_cache):
+    """Substitui @st.cache_data(ttl=...) por cache valido ate a proxima versao dos dados.
+
+    A funcao decorada recebe a versao em `versao_dados` (segundo argumento),
+    usado apenas como chave de cache; quem chama nao informa esse argumento.
+
+    Falhas nunca entram no cache: a funcao decorada propaga a excecao (o
+    st.cache_* nao guarda excecoes) e, com `mensagem_erro`, o wrapper exibe
+    o st.error e retorna `resultado_erro()`; a proxima chamada tenta de novo.
+
+    Com `compartilhado=True` o resultado e guardado uma unica vez por processo
+    (st.cache_resource) e cada chamada recebe uma visao rasa, protegida pelo
+    copy-on-write, em vez da copia desserializada que o st.cache_data entrega
+    a cada rerun de cada sessao.
+    """
+    def decorador(funcao):
+        tipo_cache = st.cache_resource if compartilhado else st.cache_data
+        funcao_cache = tipo_cache(**opcoes_cache)(funcao)
+        controle_versao_dados()['caches'][funcao.__qualname__] = funcao_cache
+
+        @functools.wraps(funcao)
+        def wrapper(engine, *args, **kwargs):
+            try:
+                resultado = funcao_cache(engine, versao_dados_atual(engine), *args, **kwargs)
+            except Exception as e:
+                if mensagem_erro is None:
+                    raise
+                st.error(f"{mensagem_erro}: {e}")
+                return resultado_erro()
+            return visao_somente_leitura(resultado) if compartilhado else resultado
+
+        wrapper.clear = funcao_cache.clear
+        return wrapper
+    return decorador
+
+# -----------------------------------------------------------------------------
+# Cache em disco (Parquet), abaixo dos caches em memoria
+# Um arquivo por (texto da consulta, parametros, versao dos dados); apos um
+# reinicio os loaders leem do disco em vez de repetir a consulta no banco.
+# -----------------------------------------------------------------------------
+
+def impressao_digital_consulta(consulta, parametros, versao):
+    """Identifica uma consulta: hash do SQL, dos parametros e da versao dos dados."""
+    conteudo = repr((str(consulta), sorted((parametros or {}).items()), versao))
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+class CacheDisco:
+    """Resultados de consultas em arquivos Parquet, com descarte LRU por tamanho."""
+
+    def __init__(self, diretorio, limite_bytes):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self.acertos = 0
+        self.falhas = 0
+        self._lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}.parquet")
+
+    def ler(self, chave):
+        """DataFrame em cache ou None; o acesso atualiza a data usada pelo LRU."""
+        caminho = self._caminho(chave)
+        try:
+            df = pd.read_parquet(caminho)
+            os.utime(caminho)
+        except (OSError, ValueError):
+            self.falhas += 1
+            return None
+        self.acertos += 1
+        return df
+
+    def gravar(self, chave, df):
+        """Grava o resultado (troca atomica) e descarta os menos usados se exceder o limite."""
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(temporario, index=False, compression='zstd')
+            os.replace(temporario, caminho)
+        except Exception:
+            # Tipos sem representacao em Parquet: o resultado fica so em memoria
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            return
+        self._descartar_excedente()
+
+    def uso(self):
+        """Quantidade de arquivos e bytes ocupados no disco."""
+        tamanhos = [
+            entrada.stat().st_size
+            for entrada in os.scandir(self.diretorio)
+            if entrada.name.endswith('.parquet')
+        ]
+        return len(tamanhos), sum(tamanhos)
+
+    def _descartar_excedente(self):
+        with self._lock:
+            arquivos = []
+            for entrada in os.scandir(self.diretorio):
+                if entrada.name.endswith('.parquet'):
+                    info = entrada.stat()
+                    arquivos.append((info.st_mtime, info.st_size, entrada.path))
+            total = sum(tamanho for _, tamanho, _ in arquivos)
+            for _, tamanho, caminho in sorted(arquivos):
+                if total <= self.limite_bytes:
+                    break
+                try:
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    pass
+                total -= tamanho
+
+@st.cache_resource
+def cache_disco():
+    """Cache em disco do processo (None se desativado ou sem pyarrow)."""
+    if not PARQUET_DISPONIVEL or LIMITE_CACHE_DISCO_MB <= 0:
+        return None
+    return CacheDisco(DIRETORIO_CACHE_DISCO, LIMITE_CACHE_DISCO_MB * 1024 ** 2)
+
+class ConsultasEmAndamento:
+    """Coalescencia (single-flight): chamadas simultaneas da mesma consulta
+    aguardam e compartilham uma unica execucao no banco."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futuros = {}
+        self.execucoes = 0
+        self.coalescidas = 0
+
+    def executar(self, chave, funcao):
+        with self._lock:
+            futuro = self._futuros.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = self._futuros[chave] = Future()
+                self.execucoes += 1
+            else:
+                self.coalescidas += 1
+        if not lider:
+            return futuro.result()
+
+        try:
+            resultado = funcao()
+        except BaseException as erro:
+            futuro.set_exception(erro)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            with self._lock:
+                del self._futuros[chave]
+
+@st.cache_resource
+def consultas_em_andamento():
+    """Registro de consultas em execucao, compartilhado entre sessoes."""
+    return ConsultasEmAndamento()
+
+def ler_sql(engine, versao_dados, consulta, parametros=None):
+    """pd.read_sql com coalescencia de chamadas simultaneas e cache em disco.
+
+    O banco so e consultado na falta do disco, e uma unica vez para todas as
+    sessoes que pedirem a mesma consulta ao mesmo tempo.
+    """
+    chave = impressao_digital_consulta(consulta, parametros, versao_dados)
+    cache = cache_disco() if versao_dados is not None else None
+
+    def executar():
+        if cache is not None:
+            df = cache.ler(chave)
+            if df is not None:
+                return df
+        df = pd.read_sql(consulta, engine, params=parametros)
+        if cache is not None:
+            cache.gravar(chave, df)
+        return df
+
+    return consultas_em_andamento().executar(chave, executar).copy(deep=False)
+
+# -----------------------------------------------------------------------------
+# Esquema compacto dos DataFrames em cache
+# Colunas de baixa cardinalidade viram categoricas e CPF/CNPJ viram chaves
+# inteiras; a conversao e feita uma vez, na saida das funcoes em cache.
+# -----------------------------------------------------------------------------
+
+COLUNAS_CATEGORICAS = (
+    'acao', 'acao_principal', 'uf', 'tipo_inciso', 'situacao_limite',
+    'flag_periodo', 'periodo_principal', 'emite_te_sc', 'emite_te',
+    'regime_no_efeito', 'situacao_cadastral', 'qualificacao', 'tipo_exclusao',
+    'fonte_dados', 'flag_maior_10pct'
+)
+
+# Chave -> quantidade de digitos (para recompor os zeros a esquerda)
+LARGURA_CHAVES = {'cpf': 11, 'cnpj_raiz': 8, 'cnpj': 14}
+
+def texto_chave(coluna, valor):
+    """CPF/CNPJ como texto com zeros a esquerda (para consultas e exportacao)."""
+    return str(valor).zfill(LARGURA_CHAVES[coluna])
+
+class EstatisticasMemoria:
+    """Memoria dos DataFrames antes e depois da compactacao, acumulada desde o inicio do processo.
+
+    Os totais nao diminuem com descartes LRU nem com a troca de versao dos
+    dados; a ocupacao atual dos caches vem de CacheLRU.bytes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datasets = {}
+
+    def registrar(self, nome, antes, depois):
+        with self._lock:
+            frames, total_antes, total_depois = self._datasets.get(nome, (0, 0, 0))
+            self._datasets[nome] = (frames + 1, total_antes + antes, total_depois + depois)
+
+    def resumo(self):
+        """DataFrame com a memoria (MB) acumulada de cada dataset antes e depois da compactacao."""
+        with self._lock:
+            linhas = [
+                (
+                    nome,
+                    frames,
+                    antes / 1024 ** 2,
+                    depois / 1024 ** 2,
+                    100 * (1 - depois / antes) if antes else 0.0
+                )
+                for nome, (frames, antes, depois) in self._datasets.items()
+            ]
+        return pd.DataFrame(
+            linhas,
+            columns=['Dataset', 'Frames compactados', 'Antes (MB, acumulado)', 'Depois (MB, acumulado)', 'Reducao (%)']
+        ).sort_values('Antes (MB, acumulado)', ascending=False)
+
+@st.cache_resource
+def estatisticas_memoria():
+    """Estatisticas de memoria compartilhadas entre sessoes."""
+    return EstatisticasMemoria()
+
+def compactar_tipos(df, nome):
+    """Aplica o esquema compacto a um DataFrame e registra a memoria economizada.
 
-@st.cache_data(ttl=3600)
-def carregar_top_grupos(_engine, limite=50):
+    CPF/CNPJ so viram inteiros quando todos os valores sao digitos; caso
+    contrario a coluna e mantida como texto.
+    """
+    if df.empty:
+        return df
+
+    antes = df.memory_usage(deep=True).sum()
+    df = df.copy()
+
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns and pd.api.types.is_string_dtype(df[coluna]):
+            df[coluna] = df[coluna].astype('category')
+
+    for coluna in LARGURA_CHAVES:
+        if coluna in df.columns and pd.api.types.is_string_dtype(df[coluna]):
+            valores = df[coluna]
+            if valores.notna().all() and valores.astype(str).str.fullmatch(r'\d+').all():
+                df[coluna] = valores.astype('int64')
+
+    estatisticas_memoria().registrar(nome, antes, df.memory_usage(deep=True).sum())
+    return df
+
+def expandir_chaves(df):
+    """Volta CPF/CNPJ inteiros para texto com zeros a esquerda (exportacao CSV)."""
+    df = df.copy()
+    for coluna in LARGURA_CHAVES:
+        if coluna in df.columns and pd.api.types.is_integer_dtype(df[coluna]):
+            df[coluna] = df[coluna].astype(str).str.zfill(LARGURA_CHAVES[coluna])
+    return df
+
+def montar_agregados(df_resumo):
+    """Separa a tabela de resumo agregado nos datasets do dashboard."""
+    agregados = {
+        'resumo_geral': {},
+        'dist_acao': pd.DataFrame(),
+        'dist_periodo': pd.DataFrame(),
+        'dist_uf': pd.DataFrame(),
+        'dist_inciso': pd.DataFrame()
+    }
+    if df_resumo.empty:
+        return agregados
+
+    def por_dimensao(dimensao):
+        df = df_resumo[df_resumo['dimensao'] == dimensao]
+        return df.rename(columns={'valor': dimensao}).reset_index(drop=True)
+
+    geral = por_dimensao('geral')
+    if not geral.empty:
+        linha = geral.iloc[0]
+        agregados['resumo_geral'] = {
+            'total_grupos': linha['qtd_grupos'],
+            'total_empresas': linha['qtd_empresas'],
+            'total_socios': linha['qtd_socios'],
+            'exclusao_com_debito': linha['qtd_exclusao_com_debito'],
+            'exclusao_sem_debito': linha['qtd_exclusao_sem_debito'],
+            'sem_interesse': linha['qtd_sem_interesse'],
+            'credito_total': linha['credito_total'],
+            'credito_medio': linha['credito_medio'],
+            'credito_maximo': linha['credito_maximo'],
+            'emite_te_sc': linha['qtd_emite_te_sc'],
+            'empresas_sc': linha['qtd_empresas_sc'],
+            'receita_total': linha['receita_total'],
+            'receita_media': linha['receita_media']
+        }
+
+    agregados['dist_acao'] = por_dimensao('acao')[[
+        'acao', 'qtd_grupos', 'qtd_empresas', 'credito_total',
+        'credito_medio', 'receita_media', 'receita_maxima'
+    ]].sort_values('qtd_grupos', ascending=False)
+
+    df_periodo = por_dimensao('flag_periodo')
+    df_periodo = df_periodo[df_periodo['flag_periodo'].notna() & (df_periodo['flag_periodo'] != '')]
+    agregados['dist_periodo'] = df_periodo[[
+        'flag_periodo', 'qtd_grupos', 'qtd_empresas', 'credito_total', 'credito_medio'
+    ]].sort_values('qtd_grupos', ascending=False)
+
+    agregados['dist_uf'] = por_dimensao('uf').rename(columns={
+        'qtd_emite_te_sc': 'emite_te',
+        'qtd_exclusao_com_debito': 'exclusao_debito'
+    })[[
+        'uf', 'qtd_grupos', 'qtd_empresas', 'credito_total',
+        'credito_medio', 'emite_te', 'exclusao_debito'
+    ]].sort_values('qtd_empresas', ascending=False)
+
+    df_inciso = por_dimensao('tipo_inciso')
+    df_inciso = df_inciso[df_inciso['tipo_inciso'].notna() & (df_inciso['tipo_inciso'] != '')]
+    agregados['dist_inciso'] = df_inciso[[
+        'tipo_inciso', 'qtd_grupos', 'qtd_empresas', 'qtd_socios',
+        'credito_total', 'receita_media'
+    ]].sort_values('qtd_grupos', ascending=False)
+
+    return agregados
+
+@cache_por_versao(
+    compartilhado=True,
+    mensagem_erro="Erro ao carregar resumo agregado",
+    resultado_erro=lambda: montar_agregados(pd.DataFrame())
+)
+def carregar_resumo_agregado(_engine, versao_dados):
+    """Carrega todos os agregados do dashboard (tabela materializada pelo pipeline)."""
+    query = f"""
+        SELECT *
+        FROM {DATABASE}.{TABELA_RESUMO_AGREGADO}
+    """
+    return montar_agregados(ler_sql(_engine, versao_dados, query))
+
+ACOES_FISCAIS = ['EXCLUSAO_COM_DEBITO', 'EXCLUSAO_SEM_DEBITO', 'SEM_INTERESSE']
+
+@cache_por_versao(compartilhado=True)
+def carregar_top_grupos(_engine, versao_dados, limite=50):
     """Carrega top grupos por credito."""
     query = f"""
-    SELECT
-        num_grupo,
-        cpf,
-        qte_cnpj,
-        qte_socio,
-        SUM(vl_ct) as vl_ct_total,
-        MAX(receita_pa_fato) as receita_maxima,
-        CASE
-            WHEN SUM(CASE WHEN acao = 'EXCLUSAO_COM_DEBITO' THEN 1 ELSE 0 END) > 0
-                THEN 'EXCLUSAO_COM_DEBITO'
-            WHEN SUM(CASE WHEN acao = 'EXCLUSAO_SEM_DEBITO' THEN 1 ELSE 0 END) > 0
-                THEN 'EXCLUSAO_SEM_DEBITO'
-            ELSE 'SEM_INTERESSE'
-        END as acao_principal,
-        MAX(flag_periodo) as periodo_principal,
-        COUNT(DISTINCT cnpj_raiz) as empresas_grupo,
-        COUNT(DISTINCT CASE WHEN uf = 'SC' THEN cnpj_raiz END) as empresas_sc,
-        COUNT(DISTINCT CASE WHEN emite_te_sc = 'S' THEN cnpj_raiz END) as te_emitir,
-        MAX(tipo_inciso) as tipo_inciso,
-        MAX(situacao_limite) as situacao_limite
-    FROM {DATABASE}.{TABELA_PRINCIPAL}
-    GROUP BY num_grupo, cpf, qte_cnpj, qte_socio
+    SELECT *
+    FROM {DATABASE}.{TABELA_GRUPO_RESUMO}
     ORDER BY vl_ct_total DESC
-    LIMIT {limite}
+    LIMIT {int(limite)}
+    """
+    return compactar_tipos(ler_sql(_engine, versao_dados, query), 'top_grupos')
+
+@cache_por_versao(max_entries=200, mensagem_erro="Erro ao carregar ranking")
+def carregar_ranking_grupos(_engine, versao_dados, acoes=(), min_credito=0, min_empresas=2, limite=50):
+    """Ranking de grupos com filtros e Top N aplicados no banco (populacao completa)."""
+    condicoes = []
+    if min_credito > 0:
+        condicoes.append(f"vl_ct_total >= {float(min_credito)}")
+    if min_empresas > 2:
+        condicoes.append(f"qte_cnpj >= {int(min_empresas)}")
+    acoes_validas = [acao for acao in acoes if acao in ACOES_FISCAIS]
+    if acoes_validas:
+        lista_acoes = ", ".join(f"'{acao}'" for acao in acoes_validas)
+        condicoes.append(f"acao_principal IN ({lista_acoes})")
+    filtro = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+    query = f"""
+        SELECT *
+        FROM {DATABASE}.{TABELA_GRUPO_RESUMO}
+        {filtro}
+        ORDER BY vl_ct_total DESC
+        LIMIT {int(limite)}
     """
-    return pd.read_sql(query, _engine)
+    return compactar_tipos(ler_sql(_engine, versao_dados, query), 'ranking_grupos')
 
-@st.cache_data(ttl=3600)
-def carregar_lista_grupos(_engine):
+@cache_por_versao(compartilhado=True, mensagem_erro="Erro ao carregar lista")
+def carregar_lista_grupos(_engine, versao_dados):
     """Carrega lista de grupos para selecao."""
-    try:
-        query = f"""
-            SELECT
-                num_grupo,
-                cpf,
-                qte_cnpj,
-                qte_socio,
-                MAX(tipo_inciso) as tipo_inciso
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            GROUP BY num_grupo, cpf, qte_cnpj, qte_socio
-            ORDER BY num_grupo
-        """
-        return pd.read_sql(query, _engine)
-    except Exception as e:
-        st.error(f"Erro ao carregar lista: {e}")
-        return pd.DataFrame()
+    query = f"""
+        SELECT
+            num_grupo,
+            cpf,
+            qte_cnpj,
+            qte_socio,
+            tipo_inciso
+        FROM {DATABASE}.{TABELA_GRUPO_RESUMO}
+        ORDER BY num_grupo
+    """
+    return compactar_tipos(ler_sql(_engine, versao_dados, query), 'lista_grupos')
+
+# -----------------------------------------------------------------------------
+# Consultas nomeadas e parametrizadas (drill-downs)
+# O texto de cada consulta e fixo; os valores sao vinculados pelo driver
+# (parametros :nome), nunca interpolados no SQL.
+# -----------------------------------------------------------------------------
+
+# Colunas de bcad_v6_output_final (PARTE 6 do pipeline) aceitas na projecao
+# das consultas; {colunas} nas consultas abaixo recebe a lista pedida
+COLUNAS_TABELA_PRINCIPAL = (
+    'num_grupo', 'qte_cnpj', 'qte_socio', 'vl_ct', 'vl_rba_pgdas', 'receita_pa_fato',
+    'cnpj', 'cnpj_raiz', 'cpf', 'uf', 'dt_ini_qualificacao', 'qualificacao',
+    'regime_no_efeito', 'flag_periodo', 'dt_fato', 'dt_efeito', 'pa_fato_ini',
+    'pa_fato_fin', 'pa_fin_resp', 'pa_resp', 'chave_cpf_raiz_pa', 'emite_te_sc',
+    'emite_te', 'acao', 'acao_prioridade', 'razao_social', 'situacao_cadastral',
+    'tipo_inciso', 'situacao_limite', 'tipo_exclusao', 'ano_apuracao',
+    'receita_bruta_empresa', 'receita_global_grupo', 'periodos_declarados',
+    'perc_participacao', 'flag_maior_10pct', 'fonte_dados', 'qtd_empresas_sn',
+    'qtd_empresas_normal', 'ufs_empresas', 'dt_processamento'
+)
+
+# Consulta em lote: identificadores por consulta `IN (...)` e colunas retornadas
+TAMANHO_LOTE_IDENTIFICADORES = 1000
+COLUNAS_CONSULTA_LOTE = (
+    'num_grupo', 'cpf', 'cnpj_raiz', 'razao_social', 'uf', 'acao', 'vl_ct',
+    'receita_pa_fato', 'tipo_inciso'
+)
+
+# Empresas por pagina na busca da Analise de Empresa
+TAMANHO_PAGINA_EMPRESAS = 50
+
+CONSULTAS = {
+    'detalhes_grupo': f"""
+        SELECT {{colunas}}
+        FROM {DATABASE}.{TABELA_PRINCIPAL}
+        WHERE num_grupo = :num_grupo
+        ORDER BY vl_ct DESC, uf, razao_social
+    """,
+    'detalhes_grupos': f"""
+        SELECT {{colunas}}
+        FROM {DATABASE}.{TABELA_PRINCIPAL}
+        WHERE num_grupo IN :grupos
+        ORDER BY num_grupo, vl_ct DESC, uf, razao_social
+    """,
+    'lote_cnpj': f"""
+        SELECT {{colunas}}
+        FROM {DATABASE}.{TABELA_PRINCIPAL}
+        WHERE cnpj_raiz IN :chaves
+    """,
+    'lote_cpf': f"""
+        SELECT {{colunas}}
+        FROM {DATABASE}.{TABELA_PRINCIPAL}
+        WHERE cpf IN :chaves
+    """,
+    'detalhes_empresa': f"""
+        SELECT {{colunas}}
+        FROM {DATABASE}.{TABELA_PRINCIPAL}
+        WHERE cnpj_raiz = :cnpj_raiz
+    """,
+    'busca_empresas': f"""
+        SELECT
+            cnpj_raiz,
+            COALESCE(razao_social, '') AS razao_social,
+            MAX(uf) AS uf,
+            MAX(situacao_cadastral) AS situacao_cadastral
+        FROM {DATABASE}.{TABELA_PRINCIPAL}
+        WHERE (:uf IS NULL OR uf = :uf)
+          AND (:prefixo_cnpj IS NULL OR cnpj_raiz LIKE :prefixo_cnpj)
+          AND (:trecho_razao IS NULL OR UPPER(razao_social) LIKE :trecho_razao)
+          AND (:apos_razao IS NULL
+               OR COALESCE(razao_social, '') > :apos_razao
+               OR (COALESCE(razao_social, '') = :apos_razao AND cnpj_raiz > :apos_cnpj))
+        GROUP BY cnpj_raiz, COALESCE(razao_social, '')
+        ORDER BY razao_social, cnpj_raiz
+        LIMIT {TAMANHO_PAGINA_EMPRESAS + 1}
+    """,
+    'historico_grupo': f"""
+        SELECT
+            ano_apuracao as ano,
+            COUNT(DISTINCT cnpj_raiz) as qtd_empresas,
+            SUM(receita_bruta_empresa) as rba_total,
+            AVG(receita_bruta_empresa) as rba_media,
+            SUM(vl_ct) as credito_total
+        FROM {DATABASE}.{TABELA_PRINCIPAL}
+        WHERE cpf = :cpf
+        GROUP BY ano_apuracao
+        ORDER BY ano_apuracao
+    """
+}
+
+class EstatisticasConsultas:
+    """Latencia das consultas nomeadas executadas no banco (por processo).
+
+    Tambem usada para o tempo de renderizacao dos graficos (`rotulo`='Grafico').
+    """
+
+    def __init__(self, amostras=500, rotulo='Consulta'):
+        self._lock = threading.Lock()
+        self._rotulo = rotulo
+        self._amostras = amostras
+        self._execucoes = {}
+        self._tempos = {}
+
+    def registrar(self, nome, segundos):
+        with self._lock:
+            self._execucoes[nome] = self._execucoes.get(nome, 0) + 1
+            self._tempos.setdefault(nome, deque(maxlen=self._amostras)).append(segundos)
+
+    def resumo(self):
+        """DataFrame com execucoes e latencias (s) das ultimas amostras de cada consulta."""
+        with self._lock:
+            linhas = [
+                (
+                    nome,
+                    self._execucoes[nome],
+                    np.mean(tempos),
+                    np.percentile(tempos, 95),
+                    max(tempos)
+                )
+                for nome, tempos in self._tempos.items()
+            ]
+        return pd.DataFrame(
+            linhas,
+            columns=[self._rotulo, 'Execucoes', 'Media (s)', 'P95 (s)', 'Maximo (s)']
+        ).sort_values('Media (s)', ascending=False)
 
-@st.cache_data(ttl=3600)
-def carregar_lista_empresas(_engine):
-    """Carrega lista de empresas cadastradas."""
+@st.cache_resource
+def estatisticas_consultas():
+    """Estatisticas de latencia compartilhadas entre sessoes."""
+    return EstatisticasConsultas()
+
+def projecao_colunas(colunas=None):
+    """Lista de colunas validada para o SELECT (todas se None)."""
+    if colunas is None:
+        return '*'
+    invalidas = [coluna for coluna in colunas if coluna not in COLUNAS_TABELA_PRINCIPAL]
+    if invalidas:
+        raise ValueError(f"Colunas desconhecidas: {invalidas}")
+    return ', '.join(colunas)
+
+def montar_consulta(nome, colunas=None):
+    """Texto da consulta nomeada com a projecao de colunas (todas se None)."""
+    return CONSULTAS[nome].format(colunas=projecao_colunas(colunas))
+
+def vincular_listas(consulta, parametros):
+    """Marca os parametros com lista de valores para expansao em `IN (...)` pelo SQLAlchemy."""
+    listas = [chave for chave, valor in parametros.items() if isinstance(valor, (list, tuple))]
+    if listas:
+        consulta = consulta.bindparams(*(bindparam(chave, expanding=True) for chave in listas))
+    return consulta
+
+def executar_consulta(engine, nome, colunas=None, versao_dados=None, **parametros):
+    """Executa uma consulta nomeada com parametros vinculados e registra a latencia.
+
+    Parametros com lista de valores sao expandidos em `IN (...)` pelo SQLAlchemy.
+    """
+    consulta = vincular_listas(text(montar_consulta(nome, colunas)), parametros)
+
+    inicio = time.perf_counter()
+    df = ler_sql(engine, versao_dados, consulta, parametros)
+    estatisticas_consultas().registrar(nome, time.perf_counter() - inicio)
+    return df
+
+class CacheLRU:
+    """Cache em memoria limitado em bytes (tamanho real dos DataFrames ou textos), com descarte LRU."""
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def obter(self, chave, funcao):
+        """Resultado em cache para a chave ou, na falta, o calculado por `funcao`."""
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._visao(self._itens[chave][0])
+            self.falhas += 1
+
+        valor = funcao()
+        self.guardar(chave, valor)
+        return self._visao(valor)
+
+    def buscar(self, chave):
+        """Resultado em cache ou None (sem calcular na falta)."""
+        with self._lock:
+            if chave not in self._itens:
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return self._visao(self._itens[chave][0])
+
+    @staticmethod
+    def _visao(valor):
+        # DataFrames sao devolvidos como copia rasa; textos sao imutaveis
+        return valor.copy(deep=False) if isinstance(valor, pd.DataFrame) else valor
+
+    def guardar(self, chave, valor):
+        """Inclui um resultado, descartando os menos usados se exceder o limite."""
+        if isinstance(valor, pd.DataFrame):
+            tamanho = int(valor.memory_usage(deep=True).sum())
+        else:
+            tamanho = sys.getsizeof(valor)
+        with self._lock:
+            if tamanho > self.limite_bytes:
+                return
+            if chave in self._itens:
+                self.bytes -= self._itens.pop(chave)[1]
+            self._itens[chave] = (valor, tamanho)
+            self.bytes += tamanho
+            while self.bytes > self.limite_bytes:
+                _, (_, tamanho_descartado) = self._itens.popitem(last=False)
+                self.bytes -= tamanho_descartado
+                self.descartes += 1
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._itens
+
+    def clear(self):
+        with self._lock:
+            self._itens.clear()
+            self.bytes = 0
+
+    def resumo(self):
+        """Contadores e ocupacao do cache."""
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                'Entradas': len(self._itens),
+                'Memoria (MB)': self.bytes / 1024 ** 2,
+                'Limite (MB)': self.limite_bytes / 1024 ** 2,
+                'Acertos': self.acertos,
+                'Falhas': self.falhas,
+                'Descartes': self.descartes,
+                'Taxa de acerto (%)': 100 * self.acertos / consultas if consultas else 0.0
+            }
+
+@st.cache_resource
+def cache_drilldowns():
+    """Cache LRU dos drill-downs, descartado quando a versao dos dados muda."""
+    cache = CacheLRU(LIMITE_CACHE_DRILLDOWN_MB * 1024 ** 2)
+    controle_versao_dados()['caches']['cache_drilldowns'] = cache
+    return cache
+
+def chave_consulta(versao, nome, colunas=None, **parametros):
+    """Chave do cache de drill-downs: (versao, consulta, colunas, parametros)."""
+    # Escalares numpy (ex.: valores vindos de DataFrames) viram tipos Python
+    parametros = {
+        chave: valor.item() if isinstance(valor, np.generic) else valor
+        for chave, valor in parametros.items()
+    }
+    colunas = tuple(colunas) if colunas is not None else None
+    return (versao, nome, colunas, tuple(sorted(parametros.items())))
+
+def consultar(engine, nome, colunas=None, **parametros):
+    """Executa uma consulta nomeada usando o cache de resultados."""
+    versao = versao_dados_atual(engine)
+    chave = chave_consulta(versao, nome, colunas, **parametros)
+    _, _, colunas, itens = chave
+    return cache_drilldowns().obter(
+        chave,
+        lambda: compactar_tipos(executar_consulta(engine, nome, colunas, versao, **dict(itens)), nome)
+    )
+
+def deduplicar_empresas(df, chaves=('cnpj_raiz',)):
+    """Mantem uma linha por empresa (a de maior credito e receita).
+
+    Retorna o DataFrame ordenado por credito e a quantidade de linhas removidas.
+    """
+    # Garantir campos
+    if 'vl_ct' not in df.columns:
+        df['vl_ct'] = 0
+    if 'receita_pa_fato' not in df.columns:
+        df['receita_pa_fato'] = 0
+
+    # Ordenar e deduplicar
+    chaves = list(chaves)
+    df = df.sort_values(
+        chaves + ['vl_ct', 'receita_pa_fato'],
+        ascending=[True] * len(chaves) + [False, False]
+    )
+    qtd_antes = len(df)
+    df = df.drop_duplicates(subset=chaves, keep='first')
+    return df.sort_values('vl_ct', ascending=False), qtd_antes - len(df)
+
+def carregar_detalhes_grupo(engine, num_grupo, colunas=None):
+    """Carrega os detalhes de um grupo especifico (todas as colunas se None)."""
     try:
-        query = f"""
-            SELECT DISTINCT
-                cnpj_raiz,
-                razao_social,
-                uf,
-                situacao_cadastral
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            ORDER BY razao_social
-            LIMIT 2000
-        """
-        return pd.read_sql(query, _engine)
+        df = consultar(engine, 'detalhes_grupo', colunas, num_grupo=num_grupo)
+
+        if not df.empty:
+            df, duplicatas = deduplicar_empresas(df)
+            if duplicatas:
+                st.info(f"{duplicatas} registros duplicados foram removidos automaticamente.")
+
+        return df
     except Exception as e:
-        st.error(f"Erro ao carregar empresas: {e}")
+        st.error(f"Erro ao carregar grupo: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=1800)
-def carregar_detalhes_grupo(_engine, num_grupo):
-    """Carrega todos os detalhes de um grupo especifico."""
-    try:
-        query = f"""
-            SELECT *
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            WHERE num_grupo = {num_grupo}
-            ORDER BY vl_ct DESC, uf, razao_social
-        """
-        df = pd.read_sql(query, _engine)
+def carregar_detalhes_grupos(engine, grupos, colunas=None):
+    """Detalhes de varios grupos: os ja presentes no cache de drill-downs sao
+    reaproveitados e os demais vem de uma unica consulta `IN (...)`.
 
-        if not df.empty:
-            # Garantir campos
-            if 'vl_ct' not in df.columns:
-                df['vl_ct'] = 0
-            if 'receita_pa_fato' not in df.columns:
-                df['receita_pa_fato'] = 0
-
-            # Ordenar e deduplicar
-            df = df.sort_values(
-                ['cnpj_raiz', 'vl_ct', 'receita_pa_fato'],
-                ascending=[True, False, False]
+    Cada grupo buscado tambem entra no cache individual, servindo depois a
+    Analise de Grupo. Retorna o DataFrame combinado e quantos grupos vieram
+    do cache.
+    """
+    try:
+        versao = versao_dados_atual(engine)
+        cache = cache_drilldowns()
+        partes, faltantes = [], []
+        for num_grupo in grupos:
+            df = cache.buscar(chave_consulta(versao, 'detalhes_grupo', colunas, num_grupo=num_grupo))
+            if df is None:
+                faltantes.append(num_grupo)
+            else:
+                partes.append(df)
+        qtd_cache = len(partes)
+
+        if faltantes:
+            df_lote = compactar_tipos(
+                executar_consulta(
+                    engine, 'detalhes_grupos', colunas, versao,
+                    grupos=[int(num_grupo) for num_grupo in faltantes]
+                ),
+                'detalhes_grupos'
             )
+            por_grupo = dict(tuple(df_lote.groupby('num_grupo', sort=False))) if not df_lote.empty else {}
+            for num_grupo in faltantes:
+                df = por_grupo.get(num_grupo, df_lote.iloc[0:0]).reset_index(drop=True)
+                cache.guardar(chave_consulta(versao, 'detalhes_grupo', colunas, num_grupo=num_grupo), df)
+                partes.append(df)
+
+        partes = [df for df in partes if not df.empty]
+        if not partes:
+            return pd.DataFrame(), qtd_cache
+        df, _ = deduplicar_empresas(pd.concat(partes, ignore_index=True), ('num_grupo', 'cnpj_raiz'))
+        return df, qtd_cache
+    except Exception as e:
+        st.error(f"Erro ao carregar grupos: {e}")
+        return pd.DataFrame(), 0
 
-            qtd_antes = len(df)
-            df = df.drop_duplicates(subset=['cnpj_raiz'], keep='first')
-            qtd_depois = len(df)
+def consultar_identificadores(engine, df_ids):
+    """Resolve CPFs e CNPJs normalizados (ver normalizar_identificadores).
 
-            if qtd_antes != qtd_depois:
-                duplicatas = qtd_antes - qtd_depois
-                st.info(f"{duplicatas} registros duplicados foram removidos automaticamente.")
+    As chaves distintas de cada tipo sao consultadas em lotes de
+    TAMANHO_LOTE_IDENTIFICADORES, em paralelo. Retorna uma linha por
+    identificador e empresa encontrada; nao encontrados ficam sem num_grupo.
+    """
+    versao = versao_dados_atual(engine)
+    lotes = []
+    for tipo, consulta in (('CNPJ', 'lote_cnpj'), ('CPF', 'lote_cpf')):
+        chaves = df_ids.loc[df_ids['tipo'] == tipo, 'chave'].drop_duplicates().tolist()
+        lotes += [
+            (tipo, consulta, chaves[i:i + TAMANHO_LOTE_IDENTIFICADORES])
+            for i in range(0, len(chaves), TAMANHO_LOTE_IDENTIFICADORES)
+        ]
+
+    def executar(lote):
+        tipo, consulta, chaves = lote
+        df = executar_consulta(engine, consulta, COLUNAS_CONSULTA_LOTE, versao, chaves=chaves)
+        return df.assign(tipo=tipo, chave=df['cnpj_raiz' if tipo == 'CNPJ' else 'cpf'].astype(str))
+
+    with ThreadPoolExecutor(
+        max_workers=MAX_CONSULTAS_PARALELAS,
+        initializer=add_script_run_ctx,
+        initargs=(None, get_script_run_ctx())
+    ) as executor:
+        partes = [df for df in executor.map(executar, lotes) if not df.empty]
+
+    if partes:
+        df_encontrados, _ = deduplicar_empresas(
+            pd.concat(partes, ignore_index=True), ('tipo', 'chave', 'num_grupo', 'cnpj_raiz')
+        )
+    else:
+        df_encontrados = pd.DataFrame(columns=['tipo', 'chave', *COLUNAS_CONSULTA_LOTE])
 
-            df = df.sort_values('vl_ct', ascending=False)
+    return df_ids.merge(df_encontrados, on=['tipo', 'chave'], how='left')
 
-        return df
+def carregar_detalhes_empresa(engine, cnpj_raiz, colunas=None):
+    """Carrega dados de uma empresa (todas as colunas se None)."""
+    try:
+        return consultar(
+            engine, 'detalhes_empresa', colunas, cnpj_raiz=texto_chave('cnpj_raiz', cnpj_raiz)
+        )
     except Exception as e:
-        st.error(f"Erro ao carregar grupo: {e}")
+        st.error(f"Erro ao carregar empresa: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=1800)
-def carregar_detalhes_empresa(_engine, cnpj_raiz):
-    """Carrega dados de uma empresa."""
+def buscar_empresas(engine, termo='', uf='Todos', apos=None):
+    """Uma pagina da busca de empresas, ordenada por razao social e CNPJ raiz.
+
+    Paginacao por chave: `apos` e o par (razao_social, cnpj_raiz) da ultima
+    empresa da pagina anterior. Retorna ate TAMANHO_PAGINA_EMPRESAS + 1
+    linhas; a linha extra indica que existe proxima pagina.
+    """
+    termo = termo.strip()
+    digitos = re.sub(r'[.\-/\s]', '', termo)
+    prefixo_cnpj = f"{digitos[:8]}%" if digitos.isdigit() else None
+    trecho_razao = None
+    if termo and prefixo_cnpj is None:
+        trecho_razao = "%" + termo.upper().replace('%', '').replace('_', '') + "%"
+
     try:
-        query = f"""
-            SELECT *
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            WHERE cnpj_raiz = '{cnpj_raiz}'
-        """
-        return pd.read_sql(query, _engine)
+        return consultar(
+            engine,
+            'busca_empresas',
+            uf=None if uf == 'Todos' else uf,
+            prefixo_cnpj=prefixo_cnpj,
+            trecho_razao=trecho_razao,
+            apos_razao=apos[0] if apos else None,
+            apos_cnpj=texto_chave('cnpj_raiz', apos[1]) if apos else None
+        )
     except Exception as e:
-        st.error(f"Erro ao carregar empresa: {e}")
+        st.error(f"Erro ao buscar empresas: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=1800)
-def carregar_historico_grupo(_engine, cpf):
+def carregar_historico_grupo(engine, cpf):
     """Carrega historico RBA do CPF/grupo usando tabelas V6."""
     try:
-        query = f"""
-            SELECT
-                ano_apuracao as ano,
-                COUNT(DISTINCT cnpj_raiz) as qtd_empresas,
-                SUM(receita_bruta_empresa) as rba_total,
-                AVG(receita_bruta_empresa) as rba_media,
-                SUM(vl_ct) as credito_total
-            FROM {DATABASE}.{TABELA_PRINCIPAL}
-            WHERE cpf = '{cpf}'
-            GROUP BY ano_apuracao
-            ORDER BY ano_apuracao
-        """
-        return pd.read_sql(query, _engine)
+        return consultar(engine, 'historico_grupo', cpf=texto_chave('cpf', cpf))
     except Exception as e:
         st.error(f"Erro ao carregar historico: {e}")
         return pd.DataFrame()
 
+class PreCarregador:
+    """Carrega em segundo plano os detalhes dos grupos que o analista deve abrir em seguida.
+
+    Um unico worker executa as consultas, uma por vez, e no maximo
+    `limite_pendentes` grupos aguardam na fila; pedidos acima do limite sao
+    descartados para nao disputar o pool do Impala com as consultas interativas.
+    """
+
+    def __init__(self, limite_pendentes):
+        self.limite_pendentes = limite_pendentes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='precarga')
+        self._lock = threading.Lock()
+        self._pendentes = set()
+        self.agendados = 0
+        self.descartados = 0
+        self.erros = 0
+
+    def agendar(self, engine, grupos):
+        """Agenda os grupos ainda fora do cache de drill-downs."""
+        versao = versao_dados_atual(engine)
+        cache = cache_drilldowns()
+        for num_grupo in grupos:
+            chave = chave_consulta(versao, 'detalhes_grupo', COLUNAS_ANALISE_GRUPO, num_grupo=num_grupo)
+            if chave in cache:
+                continue
+            with self._lock:
+                if chave in self._pendentes:
+                    continue
+                if len(self._pendentes) >= self.limite_pendentes:
+                    self.descartados += 1
+                    continue
+                self._pendentes.add(chave)
+                self.agendados += 1
+            self._executor.submit(self._carregar, engine, chave)
+
+    def _carregar(self, engine, chave):
+        _, _, _, ((_, num_grupo),) = chave
+        try:
+            consultar(engine, 'detalhes_grupo', COLUNAS_ANALISE_GRUPO, num_grupo=num_grupo)
+        except Exception:
+            self.erros += 1
+        finally:
+            with self._lock:
+                self._pendentes.discard(chave)
+
+@st.cache_resource
+def pre_carregador():
+    """Pre-carregador de grupos compartilhado entre sessoes."""
+    return PreCarregador(LIMITE_PRECARGA_PENDENTES)
+
+def grupos_para_precarregar(num_grupo, df_top, quantidade=PRECARGA_PROXIMOS_GRUPOS):
+    """Grupo destacado seguido dos proximos `quantidade` grupos na ordem do ranking.
+
+    Fora do ranking nao ha proximos: apenas o grupo destacado e pre-carregado.
+    """
+    ranking = df_top['num_grupo'].tolist() if not df_top.empty else []
+    if num_grupo not in ranking:
+        return [num_grupo]
+    inicio = ranking.index(num_grupo) + 1
+    return [num_grupo] + ranking[inicio:inicio + quantidade]
+
+# -----------------------------------------------------------------------------
+# Exportacao da tabela principal
+# As linhas chegam do banco em lotes (cursor em streaming) e cada lote e
+# gravado direto no arquivo: a memoria usada e a de um lote, qualquer que
+# seja o tamanho da exportacao.
+# -----------------------------------------------------------------------------
+
+# Formato -> (rotulo, extensao, tipo MIME)
+FORMATOS_EXPORTACAO = {
+    'csv': ('CSV (gzip)', '.csv.gz', 'application/gzip'),
+    'parquet': ('Parquet', '.parquet', 'application/vnd.apache.parquet')
+}
+
+def filtro_exportacao(ufs=(), acoes=(), ano_inicial=None, ano_final=None):
+    """Clausula WHERE e parametros vinculados dos filtros da exportacao."""
+    condicoes = []
+    parametros = {}
+    if ufs:
+        condicoes.append("uf IN :ufs")
+        parametros['ufs'] = list(ufs)
+    if acoes:
+        condicoes.append("acao IN :acoes")
+        parametros['acoes'] = list(acoes)
+    if ano_inicial is not None:
+        condicoes.append("ano_apuracao >= :ano_inicial")
+        parametros['ano_inicial'] = int(ano_inicial)
+    if ano_final is not None:
+        condicoes.append("ano_apuracao <= :ano_final")
+        parametros['ano_final'] = int(ano_final)
+    filtro = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    return filtro, parametros
+
+class EscritorExportacao:
+    """Grava lotes em CSV gzip ou Parquet (um row group por lote).
+
+    Com pyarrow o CSV e escrito pelo Arrow (bem mais rapido que o to_csv do
+    pandas); sem ele, pelo pandas.
+    """
+
+    def __init__(self, caminho, formato):
+        self.caminho = caminho
+        self.formato = formato
+        self._csv = None
+        self._parquet = None
+        self._schema = None
+        self._cabecalho = True
+
+    def __enter__(self):
+        if self.formato == 'csv':
+            # Nivel 3: quase 3x mais rapido que o padrao, arquivo ~15% maior
+            self._csv = gzip.open(self.caminho, 'wb', compresslevel=3)
+            # BOM para o Excel reconhecer UTF-8, como nos demais downloads CSV
+            self._csv.write('\ufeff'.encode('utf-8'))
+        return self
+
+    @staticmethod
+    def _tabela_arrow(lote):
+        if isinstance(lote, pd.DataFrame):
+            return pa.Table.from_pandas(lote, preserve_index=False)
+        return pa.Table.from_batches([lote])
+
+    def gravar(self, lote):
+        """Grava um lote (DataFrame ou RecordBatch do Arrow)."""
+        if self.formato == 'csv':
+            if PARQUET_DISPONIVEL:
+                pa_csv.write_csv(
+                    self._tabela_arrow(lote),
+                    self._csv,
+                    write_options=pa_csv.WriteOptions(include_header=self._cabecalho)
+                )
+            else:
+                self._csv.write(lote.to_csv(index=False, header=self._cabecalho).encode('utf-8'))
+            self._cabecalho = False
+            return
+
+        tabela = self._tabela_arrow(lote)
+        if self._parquet is None:
+            # O schema do arquivo vem do primeiro lote; colunas sem nenhum
+            # valor nele ficam como texto
+            self._schema = pa.schema([
+                campo.with_type(pa.string()) if pa.types.is_null(campo.type) else campo
+                for campo in tabela.schema
+            ])
+            self._parquet = pq.ParquetWriter(self.caminho, self._schema, compression='zstd')
+        self._parquet.write_table(tabela.cast(self._schema))
+
+    def __exit__(self, *erro):
+        if self._csv is not None:
+            self._csv.close()
+        if self._parquet is not None:
+            self._parquet.close()
+
+def limpar_exportacoes_antigas():
+    """Apaga os arquivos de exportacao com mais de VALIDADE_EXPORTACOES_HORAS."""
+    if not os.path.isdir(DIRETORIO_EXPORTACOES):
+        return
+    limite = time.time() - VALIDADE_EXPORTACOES_HORAS * 3600
+    for nome in os.listdir(DIRETORIO_EXPORTACOES):
+        caminho = os.path.join(DIRETORIO_EXPORTACOES, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+def novo_arquivo_exportacao(prefixo, sufixo):
+    """Cria um arquivo temporario vazio em DIRETORIO_EXPORTACOES e retorna o caminho."""
+    limpar_exportacoes_antigas()
+    os.makedirs(DIRETORIO_EXPORTACOES, exist_ok=True)
+    descritor, caminho = tempfile.mkstemp(prefix=prefixo, suffix=sufixo, dir=DIRETORIO_EXPORTACOES)
+    os.close(descritor)
+    return caminho
+
+def contar_linhas_exportacao(engine, **filtros):
+    """Quantidade de linhas da tabela principal que atendem aos filtros."""
+    filtro, parametros = filtro_exportacao(**filtros)
+    consulta = vincular_listas(
+        text(f"SELECT COUNT(*) AS total FROM {DATABASE}.{TABELA_PRINCIPAL} {filtro}"),
+        parametros
+    )
+    return int(pd.read_sql(consulta, engine, params=parametros)['total'].iloc[0])
+
+def lotes_exportacao(conn, consulta, parametros):
+    """Resultado da consulta em lotes de ate LINHAS_POR_LOTE_EXPORTACAO linhas."""
+    if conn.dialect.name == 'duckdb':
+        # O DuckDB entrega o resultado em record batches do Arrow, sem
+        # materializar as linhas como tuplas Python
+        cursor = conn.execute(consulta, parametros).cursor
+        leitor = getattr(cursor, 'to_arrow_reader', None) or cursor.fetch_record_batch
+        yield from leitor(LINHAS_POR_LOTE_EXPORTACAO)
+    else:
+        yield from pd.read_sql(
+            consulta,
+            conn.execution_options(stream_results=True),
+            params=parametros,
+            chunksize=LINHAS_POR_LOTE_EXPORTACAO
+        )
+
+def exportar_tabela_principal(engine, formato='csv', colunas=None, progresso=None, **filtros):
+    """Exporta as linhas filtradas da tabela principal para um arquivo temporario.
+
+    Le LINHAS_POR_LOTE_EXPORTACAO linhas por vez e chama `progresso(linhas)`
+    apos gravar cada lote. Retorna o caminho do arquivo e o total de linhas.
+    """
+    if formato == 'parquet' and not PARQUET_DISPONIVEL:
+        raise RuntimeError("Exportacao em Parquet requer o pacote pyarrow.")
+
+    filtro, parametros = filtro_exportacao(**filtros)
+    consulta = vincular_listas(
+        text(f"SELECT {projecao_colunas(colunas)} FROM {DATABASE}.{TABELA_PRINCIPAL} {filtro}"),
+        parametros
+    )
+
+    caminho = novo_arquivo_exportacao(f"{TABELA_PRINCIPAL}_", FORMATOS_EXPORTACAO[formato][1])
+    linhas = 0
+    try:
+        with engine.connect() as conn, EscritorExportacao(caminho, formato) as escritor:
+            for lote in lotes_exportacao(conn, consulta, parametros):
+                escritor.gravar(lote)
+                linhas += len(lote)
+                if progresso is not None:
+                    progresso(linhas)
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho, linhas
+
+def ler_arquivo_exportacao(caminho):
+    """Conteudo do arquivo exportado (lido apenas quando o usuario clica em download)."""
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read()
+
+# -----------------------------------------------------------------------------
+# Dossies dos grupos com debito
+# Uma pasta por grupo EXCLUSAO_COM_DEBITO com as empresas, a composicao do
+# credito e o historico de receita. As linhas vem em poucas consultas
+# `IN (...)`; os arquivos sao montados em processos separados e reunidos
+# em um unico ZIP.
+# -----------------------------------------------------------------------------
+
+COLUNAS_DOSSIE = (
+    'num_grupo', 'cpf', 'cnpj_raiz', 'razao_social', 'uf', 'situacao_cadastral',
+    'acao', 'tipo_exclusao', 'vl_ct', 'receita_pa_fato', 'receita_bruta_empresa',
+    'ano_apuracao', 'flag_periodo', 'emite_te_sc', 'tipo_inciso', 'situacao_limite'
+)
+
+def listar_grupos_dossie(engine, limite=None, min_credito=0):
+    """Grupos EXCLUSAO_COM_DEBITO por credito decrescente (todos se `limite` for None).
+
+    O resumo tem uma linha por grupo/socio: os grupos sao agregados antes do
+    limite, para que cada grupo conte uma unica vez.
+    """
+    query = f"""
+        SELECT num_grupo
+        FROM {DATABASE}.{TABELA_GRUPO_RESUMO}
+        WHERE acao_principal = 'EXCLUSAO_COM_DEBITO'
+        GROUP BY num_grupo
+        HAVING MAX(vl_ct_total) >= {float(min_credito)}
+        ORDER BY MAX(vl_ct_total) DESC, num_grupo
+        {f"LIMIT {int(limite)}" if limite else ""}
+    """
+    return pd.read_sql(query, engine)['num_grupo'].tolist()
+
+def csv_bytes(df):
+    """CSV (UTF-8 com BOM, como nos downloads do dashboard) de um DataFrame."""
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+def montar_dossies(df):
+    """Tarefa executada no pool de processos: dossies dos grupos presentes em `df`.
+
+    As agregacoes sao feitas uma vez para todos os grupos da tarefa e depois
+    separadas por grupo. Retorna ({caminho no ZIP: bytes}, linhas do indice).
+    """
+    empresas, _ = deduplicar_empresas(df, ('num_grupo', 'cnpj_raiz'))
+
+    credito = (
+        df.groupby(['num_grupo', 'ano_apuracao', 'uf', 'acao'], dropna=False)
+        .agg(qtd_empresas=('cnpj_raiz', 'nunique'), credito_total=('vl_ct', 'sum'))
+        .reset_index()
+        .sort_values(['num_grupo', 'credito_total'], ascending=[True, False])
+    )
+    credito_grupo = credito.groupby('num_grupo')['credito_total'].transform('sum')
+    credito['percentual'] = (credito['credito_total'] / credito_grupo * 100).where(credito_grupo != 0, 0.0).round(2)
+
+    historico = (
+        df.groupby(['num_grupo', 'ano_apuracao'])
+        .agg(
+            qtd_empresas=('cnpj_raiz', 'nunique'),
+            rba_total=('receita_bruta_empresa', 'sum'),
+            rba_media=('receita_bruta_empresa', 'mean'),
+            credito_total=('vl_ct', 'sum')
+        )
+        .reset_index()
+        .rename(columns={'ano_apuracao': 'ano'})
+    )
+
+    indice = (
+        df.groupby('num_grupo', sort=False)
+        .agg(cpf=('cpf', 'first'), credito_total=('vl_ct', 'sum'), receita_maxima=('receita_pa_fato', 'max'))
+        .join(empresas.assign(sc=empresas['uf'] == 'SC').groupby('num_grupo').agg(
+            empresas=('cnpj_raiz', 'size'),
+            empresas_sc=('sc', 'sum')
+        ))
+        .reset_index()
+    )
+    indice['pasta'] = 'grupo_' + indice['num_grupo'].astype(str)
+
+    arquivos = {}
+    for nome, tabela in (('empresas', empresas), ('credito', credito), ('historico_receita', historico)):
+        for num_grupo, tabela_grupo in tabela.groupby('num_grupo', sort=False):
+            if nome != 'empresas':
+                tabela_grupo = tabela_grupo.drop(columns='num_grupo')
+            arquivos[f"grupo_{num_grupo}/{nome}.csv"] = csv_bytes(tabela_grupo)
+    return arquivos, indice
+
+def gerar_dossies(engine, grupos, progresso=None):
+    """Gera o ZIP com os dossies dos `grupos` em um arquivo temporario.
+
+    As consultas de cada lote de grupos sao feitas enquanto os processos
+    montam os arquivos do lote anterior. `progresso(concluidos, total)` e
+    chamado a cada tarefa concluida. Retorna o caminho do ZIP e a quantidade
+    de grupos com dados.
+    """
+    caminho = novo_arquivo_exportacao('dossies_', '.zip')
+    total = len(grupos)
+    concluidos = 0
+    partes_indice = []
+
+    try:
+        with ProcessPoolExecutor(max_workers=PROCESSOS_DOSSIES) as executor, \
+                zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+            pendentes = {}
+
+            def gravar(futuro):
+                nonlocal concluidos
+                arquivos, indice = futuro.result()
+                for nome in sorted(arquivos):
+                    arquivo_zip.writestr(nome, arquivos[nome])
+                partes_indice.append(indice)
+                concluidos += pendentes.pop(futuro)
+                if progresso is not None:
+                    progresso(concluidos, total)
+
+            for inicio in range(0, total, GRUPOS_POR_CONSULTA_DOSSIE):
+                lote = [int(num_grupo) for num_grupo in grupos[inicio:inicio + GRUPOS_POR_CONSULTA_DOSSIE]]
+                df_lote = executar_consulta(engine, 'detalhes_grupos', COLUNAS_DOSSIE, grupos=lote)
+                grupos_lote = df_lote['num_grupo'].unique()
+                # Grupos sem linhas contam como concluidos
+                concluidos += len(lote) - len(grupos_lote)
+
+                for posicao in range(0, len(grupos_lote), GRUPOS_POR_TAREFA_DOSSIE):
+                    # No maximo duas tarefas por processo na fila do pool
+                    while len(pendentes) >= PROCESSOS_DOSSIES * 2:
+                        concluidas, _ = wait(list(pendentes), return_when=FIRST_COMPLETED)
+                        for futuro in concluidas:
+                            gravar(futuro)
+                    tarefa = grupos_lote[posicao:posicao + GRUPOS_POR_TAREFA_DOSSIE]
+                    df_tarefa = df_lote[df_lote['num_grupo'].isin(tarefa)]
+                    pendentes[executor.submit(montar_dossies, df_tarefa)] = len(tarefa)
+                for futuro in [futuro for futuro in pendentes if futuro.done()]:
+                    gravar(futuro)
+
+            for futuro in as_completed(list(pendentes)):
+                gravar(futuro)
+
+            df_indice = pd.concat(partes_indice, ignore_index=True) if partes_indice else pd.DataFrame()
+            if not df_indice.empty:
+                df_indice = df_indice.sort_values('credito_total', ascending=False)
+            arquivo_zip.writestr('indice.csv', csv_bytes(df_indice))
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho, len(df_indice)
+
+def listar_dossies():
+    """ZIPs gerados pelo comando `dossies` em DIRETORIO_DOSSIES, do mais recente ao mais antigo."""
+    linhas = []
+    if os.path.isdir(DIRETORIO_DOSSIES):
+        for nome in os.listdir(DIRETORIO_DOSSIES):
+            if not nome.endswith('.zip'):
+                continue
+            caminho = os.path.join(DIRETORIO_DOSSIES, nome)
+            try:
+                with zipfile.ZipFile(caminho) as arquivo_zip:
+                    qtd_grupos = sum(1 for item in arquivo_zip.namelist() if item.endswith('/empresas.csv'))
+                informacoes = os.stat(caminho)
+            except (OSError, zipfile.BadZipFile):
+                continue
+            linhas.append((
+                nome,
+                qtd_grupos,
+                informacoes.st_size / 1024 ** 2,
+                datetime.fromtimestamp(informacoes.st_mtime)
+            ))
+    return pd.DataFrame(
+        linhas,
+        columns=['Arquivo', 'Grupos', 'Tamanho (MB)', 'Gerado em']
+    ).sort_values('Gerado em', ascending=False)
+
+# Registro de consultas: nome -> funcao que executa a consulta.
+CARREGADORES_DADOS = {
+    'resumo_agregado': carregar_resumo_agregado,
+    'top_grupos': lambda engine: carregar_top_grupos(engine, 50),
+    'lista_grupos': carregar_lista_grupos
+}
+
+# Registro de datasets: chave em `dados` -> (consulta, parte do resultado).
+# Cada pagina declara em PAGINAS apenas as chaves de que precisa; datasets
+# servidos pela mesma consulta sao carregados uma unica vez.
+DATASETS = {
+    'resumo_geral': ('resumo_agregado', 'resumo_geral'),
+    'dist_acao': ('resumo_agregado', 'dist_acao'),
+    'dist_periodo': ('resumo_agregado', 'dist_periodo'),
+    'dist_uf': ('resumo_agregado', 'dist_uf'),
+    'dist_inciso': ('resumo_agregado', 'dist_inciso'),
+    'top_grupos': ('top_grupos', None),
+    'lista_grupos': ('lista_grupos', None)
+}
+
+def carregar_dados_pagina(engine, datasets):
+    """Carrega em paralelo os datasets declarados pela pagina.
+
+    Retorna o dicionario `dados` e os tempos de parede (segundos) de cada
+    consulta, alem do tempo total da etapa em '_total'.
+    """
+    consultas = list(dict.fromkeys(DATASETS[chave][0] for chave in datasets))
+    ctx = get_script_run_ctx()
+    tempos = {}
+
+    def executar(nome):
+        inicio = time.perf_counter()
+        resultado = CARREGADORES_DADOS[nome](engine)
+        tempos[nome] = time.perf_counter() - inicio
+        return resultado
+
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(
+        max_workers=MAX_CONSULTAS_PARALELAS,
+        initializer=add_script_run_ctx,
+        initargs=(None, ctx)
+    ) as executor:
+        futuros = {nome: executor.submit(executar, nome) for nome in consultas}
+        resultados = {nome: futuro.result() for nome, futuro in futuros.items()}
+    tempos['_total'] = time.perf_counter() - inicio_total
+
+    dados = {}
+    for chave in datasets:
+        consulta, parte = DATASETS[chave]
+        resultado = resultados[consulta]
+        dados[chave] = resultado if parte is None else resultado[parte]
+
+    return dados, tempos
+
 # =============================================================================
 # 6. FUNCOES AUXILIARES
 # =============================================================================
@@ -492,6 +1789,32 @@ def formatar_cpf(cpf):
         return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:11]}"
     return cpf
 
+def normalizar_identificadores(identificadores):
+    """Classifica e normaliza uma serie de CPFs/CNPJs (com ou sem mascara).
+
+    Considera apenas os digitos: ate 8 e CNPJ raiz, 9 a 11 e CPF e 12 a 14 e
+    CNPJ completo (reduzido a raiz); os demais sao invalidos. Retorna o
+    DataFrame com identificador original, tipo ('CNPJ', 'CPF' ou 'INVALIDO')
+    e chave (cnpj_raiz com 8 digitos ou CPF com 11).
+    """
+    originais = identificadores.astype(str).str.strip()
+    digitos = originais.str.replace(r'\D', '', regex=True)
+    tamanho = digitos.str.len()
+
+    tipo = np.select(
+        [(tamanho >= 1) & (tamanho <= 8), (tamanho >= 9) & (tamanho <= 11), (tamanho >= 12) & (tamanho <= 14)],
+        ['CNPJ', 'CPF', 'CNPJ'],
+        default='INVALIDO'
+    )
+    chave = np.select(
+        [tamanho <= 8, tamanho <= 11, tamanho <= 14],
+        [digitos.str.zfill(8), digitos.str.zfill(11), digitos.str.zfill(14).str[:8]],
+        default=''
+    )
+    return pd.DataFrame({'identificador': originais, 'tipo': tipo, 'chave': chave}).assign(
+        chave=lambda df: df['chave'].where(df['tipo'] != 'INVALIDO', '')
+    )
+
 def formatar_moeda(valor):
     """Formata valor monetario."""
     if pd.isna(valor) or valor == 0:
@@ -507,25 +1830,219 @@ def formatar_periodo(periodo):
         return f"{periodo_str[4:6]}/{periodo_str[0:4]}"
     return periodo_str
 
+BADGES_ACAO = {
+    'EXCLUSAO_COM_DEBITO': 'Exclusao c/ Debito',
+    'EXCLUSAO_SEM_DEBITO': 'Exclusao s/ Debito'
+}
+
+BADGES_INCISO = {
+    'INCISO_III': 'III - 2+ empresas SN',
+    'INCISO_IV': 'IV - >10% em nao-SN',
+    'AMBOS': 'III e IV'
+}
+
 def criar_badge_acao(acao):
     """Cria badge visual para acao."""
-    if acao == 'EXCLUSAO_COM_DEBITO':
-        return 'Exclusao c/ Debito'
-    elif acao == 'EXCLUSAO_SEM_DEBITO':
-        return 'Exclusao s/ Debito'
-    else:
-        return 'Sem Interesse'
+    return BADGES_ACAO.get(acao, 'Sem Interesse')
 
 def criar_badge_inciso(tipo_inciso):
     """Cria badge para tipo de inciso."""
-    if tipo_inciso == 'INCISO_III':
-        return 'III - 2+ empresas SN'
-    elif tipo_inciso == 'INCISO_IV':
-        return 'IV - >10% em nao-SN'
-    elif tipo_inciso == 'AMBOS':
-        return 'III e IV'
-    else:
-        return tipo_inciso
+    return BADGES_INCISO.get(tipo_inciso, tipo_inciso)
+
+# -----------------------------------------------------------------------------
+# Formatacao vetorizada (colunas inteiras)
+# Mesmo texto das funcoes acima, montado com operacoes de array do numpy em
+# vez de uma chamada Python por celula.
+# -----------------------------------------------------------------------------
+
+def _texto_de_matriz(matriz, comprimentos):
+    """Textos de uma matriz de bytes transposta (uma coluna por valor, alinhada
+    embaixo e completada com bytes nulos em cima): decodifica o bloco uma vez e fatia."""
+    matriz = np.ascontiguousarray(matriz.T)
+    texto = matriz[matriz != 0].tobytes().decode('ascii')
+    fins = np.cumsum(comprimentos)
+    inicios = fins - comprimentos
+    return [texto[inicio:fim] for inicio, fim in zip(inicios.tolist(), fins.tolist())]
+
+def _escrever_digitos(matriz, numeros, colunas, qtd_digitos):
+    """Escreve os `qtd_digitos` digitos finais de `numeros` nas posicoes dadas (do fim)."""
+    restante = numeros.copy()
+    for coluna in colunas[:qtd_digitos]:
+        matriz[coluna] = ord('0') + restante % 10
+        restante //= 10
+
+def formatar_moeda_coluna(valores):
+    """Versao vetorizada de formatar_moeda."""
+    valores = pd.Series(valores)
+    numeros = pd.to_numeric(valores, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    resultado = np.full(len(numeros), "R$ 0,00", dtype=object)
+
+    preenchidos = ~np.isnan(numeros) & (numeros != 0)
+    centavos_exatos = np.abs(numeros) * 100
+    # Meio centavo (apos a multiplicacao) e valores enormes/infinitos podem
+    # arredondar diferente do format do Python: esses usam a funcao escalar
+    with np.errstate(invalid='ignore'):
+        casos_limite = preenchidos & (
+            ~np.isfinite(numeros)
+            | (np.abs(numeros) >= 1e13)
+            | (np.abs(centavos_exatos % 1 - 0.5) < 1e-6)
+        )
+    vetorizados = preenchidos & ~casos_limite
+
+    if vetorizados.any():
+        centavos = np.rint(centavos_exatos[vetorizados]).astype(np.int64)
+        negativos = numeros[vetorizados] < 0
+        inteiros = centavos // 100
+
+        qtd_digitos = np.ones(len(inteiros), dtype=np.int64)
+        restante = inteiros // 10
+        while restante.any():
+            qtd_digitos += restante > 0
+            restante //= 10
+
+        # Texto alinhado a direita: "R$ [-]d.ddd.ddd,cc". A matriz e transposta
+        # (uma linha por posicao do texto) para cada escrita ser contigua.
+        comprimentos = 3 + negativos + qtd_digitos + (qtd_digitos - 1) // 3 + 3
+        largura = int(comprimentos.max())
+        linhas = np.arange(len(inteiros))
+        matriz = np.zeros((largura, len(inteiros)), dtype=np.uint8)
+
+        _escrever_digitos(matriz, centavos % 100, [largura - 1, largura - 2], 2)
+        matriz[largura - 3] = ord(',')
+        restante = inteiros.copy()
+        for digito in range(int(qtd_digitos.max())):
+            coluna = largura - 4 - digito - digito // 3
+            ativo = digito < qtd_digitos
+            if digito and digito % 3 == 0:
+                matriz[coluna + 1] = np.where(ativo, ord('.'), 0)
+            matriz[coluna] = np.where(ativo, ord('0') + restante % 10, 0)
+            restante //= 10
+
+        inicio = largura - 3 - qtd_digitos - (qtd_digitos - 1) // 3
+        matriz[inicio[negativos] - 1, negativos] = ord('-')
+        inicio = inicio - negativos
+        for deslocamento, caractere in zip((1, 2, 3), ' $R'):
+            matriz[inicio - deslocamento, linhas] = ord(caractere)
+
+        resultado[vetorizados] = _texto_de_matriz(matriz, comprimentos)
+
+    if casos_limite.any():
+        resultado[casos_limite] = [formatar_moeda(valor) for valor in numeros[casos_limite]]
+    return pd.Series(resultado, index=valores.index, dtype=object)
+
+def _formatar_chave_coluna(valores, qtd_digitos, separadores, funcao_escalar):
+    """Mascara CPF/CNPJ: chaves inteiras (esquema compacto) direto por aritmetica;
+    os demais tipos pela funcao escalar em cada valor distinto."""
+    valores = pd.Series(valores)
+    if pd.api.types.is_integer_dtype(valores) and len(valores):
+        numeros = valores.to_numpy(dtype=np.int64)
+        if numeros.min() >= 0 and numeros.max() < 10 ** qtd_digitos:
+            largura = qtd_digitos + len(separadores)
+            matriz = np.zeros((largura, len(numeros)), dtype=np.uint8)
+            colunas_digitos = [
+                coluna for coluna in range(largura - 1, -1, -1)
+                if coluna not in separadores
+            ]
+            _escrever_digitos(matriz, numeros, colunas_digitos, qtd_digitos)
+            for coluna, caractere in separadores.items():
+                matriz[coluna] = ord(caractere)
+            texto = _texto_de_matriz(matriz, np.full(len(numeros), largura))
+            return pd.Series(texto, index=valores.index, dtype=object)
+    return aplicar_por_valor(valores, funcao_escalar)
+
+def aplicar_por_valor(valores, funcao):
+    """Aplica `funcao` uma vez por valor distinto e replica o resultado na coluna."""
+    valores = pd.Series(valores)
+    codigos, distintos = pd.factorize(valores, use_na_sentinel=True)
+    resultados = np.array([funcao(valor) for valor in distintos] + [funcao(np.nan)], dtype=object)
+    return pd.Series(resultados[codigos], index=valores.index, dtype=object)
+
+def formatar_cpf_coluna(cpfs):
+    """Versao vetorizada de formatar_cpf."""
+    return _formatar_chave_coluna(cpfs, 11, {3: '.', 7: '.', 11: '-'}, formatar_cpf)
+
+def formatar_cnpj_coluna(cnpjs):
+    """Versao vetorizada de formatar_cnpj."""
+    return _formatar_chave_coluna(cnpjs, 8, {2: '.', 6: '.'}, formatar_cnpj)
+
+def criar_badge_acao_coluna(acoes):
+    """Versao vetorizada de criar_badge_acao."""
+    return aplicar_por_valor(acoes, criar_badge_acao)
+
+def criar_badge_inciso_coluna(incisos):
+    """Versao vetorizada de criar_badge_inciso."""
+    return aplicar_por_valor(incisos, criar_badge_inciso)
+
+# -----------------------------------------------------------------------------
+# Busca incremental (selecao de grupo)
+# -----------------------------------------------------------------------------
+
+LIMITE_OPCOES_BUSCA = 1000
+
+class IndiceBusca:
+    """Indice em memoria para busca enquanto o usuario digita.
+
+    Identificadores numericos (grupo, CPF) ficam em arrays ordenados para
+    busca por prefixo via busca binaria. Os rotulos das opcoes sao pre-calculados.
+    """
+
+    def __init__(self, ids, rotulos, chaves_digitos):
+        self._ids = np.asarray(ids)
+        self.rotulos = dict(zip(ids, rotulos))
+
+        self._chaves_digitos = []
+        for chaves in chaves_digitos:
+            chaves = np.asarray(chaves, dtype=str)
+            ordem = np.argsort(chaves, kind='stable')
+            self._chaves_digitos.append((chaves[ordem], ordem))
+
+    def rotulo(self, id_opcao):
+        return self.rotulos.get(id_opcao, str(id_opcao))
+
+    @staticmethod
+    def _faixa_prefixo(chaves_ordenadas, prefixo):
+        chaves, ordem = chaves_ordenadas
+        inicio = np.searchsorted(chaves, prefixo, side='left')
+        # '\uffff' e maior que qualquer caractere usado nas chaves
+        fim = np.searchsorted(chaves, prefixo + '\uffff', side='left')
+        return ordem[inicio:fim]
+
+    def _posicoes(self, termo):
+        """Posicoes que casam com o termo (None = sem termo, todas)."""
+        termo = termo.strip()
+        if not termo:
+            return None
+
+        digitos = re.sub(r'[.\-/\s]', '', termo)
+        if not digitos.isdigit():
+            return np.array([], dtype=np.int64)
+        encontrados = [self._faixa_prefixo(chaves, digitos) for chaves in self._chaves_digitos]
+        return np.unique(np.concatenate(encontrados)) if encontrados else np.array([], dtype=np.int64)
+
+    def buscar(self, termo='', limite=LIMITE_OPCOES_BUSCA):
+        """Retorna (ids das primeiras `limite` opcoes, total de ids encontrados)."""
+        posicoes = self._posicoes(termo)
+        if posicoes is None:
+            posicoes = np.arange(len(self._ids))
+        ids = pd.unique(self._ids[posicoes])
+        return ids[:limite].tolist(), len(ids)
+
+@st.cache_resource(max_entries=2)
+def indice_busca_grupos(_lista_grupos, versao_dados):
+    """Indice de busca da lista de grupos (numero do grupo e CPF)."""
+    rotulos_df = _lista_grupos.drop_duplicates('num_grupo')
+    rotulos = dict(zip(
+        rotulos_df['num_grupo'],
+        "Grupo " + rotulos_df['num_grupo'].astype(str) + " - " + rotulos_df['qte_cnpj'].astype(str) + " empresas"
+    ))
+    return IndiceBusca(
+        ids=_lista_grupos['num_grupo'].tolist(),
+        rotulos=[rotulos[num_grupo] for num_grupo in _lista_grupos['num_grupo']],
+        chaves_digitos=[
+            _lista_grupos['num_grupo'].astype(str),
+            _lista_grupos['cpf'].astype(str).str.zfill(11)
+        ]
+    )
 
 def criar_filtros_sidebar():
     """Cria filtros visuais na sidebar."""
@@ -538,11 +2055,159 @@ def criar_filtros_sidebar():
         )
     return {'tema': tema}
 
+# -----------------------------------------------------------------------------
+# Cache de figuras Plotly
+# Cada grafico e montado uma vez por (versao dos dados, grafico, tema,
+# parametros) e guardado como JSON; nos reruns seguintes a figura e
+# reconstruida do JSON, sem refazer os dados nem validar a figura de novo.
+# -----------------------------------------------------------------------------
+
+@st.cache_resource
+def cache_figuras():
+    """Cache LRU das figuras serializadas, descartado quando a versao dos dados muda."""
+    cache = CacheLRU(LIMITE_CACHE_FIGURAS_MB * 1024 ** 2)
+    controle_versao_dados()['caches']['cache_figuras'] = cache
+    return cache
+
+@st.cache_resource
+def estatisticas_figuras():
+    """Tempo de renderizacao dos graficos, separado entre montagem e cache."""
+    return EstatisticasConsultas(rotulo='Grafico')
+
+def exibir_figura(versao, id_grafico, tema, construir, **parametros):
+    """Exibe o grafico `id_grafico`; `construir()` so e chamado na falta do cache.
+
+    `versao` e a versao atual dos dados (versao_dados_atual) e os `parametros`
+    sao os filtros que determinam os dados do grafico. Sem versao conhecida o
+    grafico e montado sem passar pelo cache.
+    """
+    inicio = time.perf_counter()
+    montagens = []
+
+    def montar():
+        montagens.append(id_grafico)
+        return construir().to_json()
+
+    if versao is None:
+        figura_json = montar()
+    else:
+        chave = chave_consulta(versao, id_grafico, tema=tema, **parametros)
+        figura_json = cache_figuras().obter(chave, montar)
+    # O JSON veio de uma figura ja validada: a reconstrucao dispensa validacao
+    st.plotly_chart(go.Figure(json.loads(figura_json), _validate=False), use_container_width=True)
+    origem = 'montagem' if montagens else 'cache'
+    estatisticas_figuras().registrar(f"{id_grafico} ({origem})", time.perf_counter() - inicio)
+
+# -----------------------------------------------------------------------------
+# Fragmentos interativos
+# As secoes com widgets (filtros do ranking, buscas, detalhe do grupo) rodam
+# como st.fragment: uma interacao reexecuta apenas a secao, sem autenticacao,
+# teste de conexao, loaders e sidebar. Cada execucao e medida.
+# -----------------------------------------------------------------------------
+
+@st.cache_resource
+def estatisticas_interacoes():
+    """Latencia das execucoes completas e das reexecucoes isoladas dos fragmentos."""
+    return EstatisticasConsultas(rotulo='Interacao')
+
+def fragmento_medido(nome):
+    """Decorador: executa a secao como `st.fragment` e registra o tempo de cada execucao.
+
+    Execucoes junto com a pagina sao registradas como "nome (pagina)" e as
+    disparadas por widgets da propria secao como "nome (fragmento)". Erros sao
+    exibidos como no roteamento de `main`, que nao envolve as reexecucoes isoladas.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            except Exception as e:
+                st.error(f"Erro ao carregar pagina: {str(e)}")
+                st.exception(e)
+            finally:
+                ctx = get_script_run_ctx()
+                origem = 'fragmento' if ctx is not None and ctx.fragment_ids_this_run else 'pagina'
+                estatisticas_interacoes().registrar(f"{nome} ({origem})", time.perf_counter() - inicio)
+
+        return st.fragment(medida)
+    return decorador
+
+def exibir_estatisticas_consultas():
+    """Exibe na sidebar a latencia das consultas nomeadas (drill-downs)."""
+    df_estatisticas = estatisticas_consultas().resumo()
+    if df_estatisticas.empty:
+        return
+
+    with st.sidebar.expander("Latencia das Consultas", expanded=False):
+        st.dataframe(df_estatisticas.round(3), use_container_width=True, hide_index=True)
+        andamento = consultas_em_andamento()
+        st.caption(
+            f"Consultas coalescidas: {andamento.coalescidas:,} "
+            f"(aguardaram uma execucao identica; {andamento.execucoes:,} executadas)"
+        )
+
+def exibir_estatisticas_figuras():
+    """Exibe na sidebar o tempo de renderizacao dos graficos (montagem x cache)."""
+    df_figuras = estatisticas_figuras().resumo()
+    if df_figuras.empty:
+        return
+
+    with st.sidebar.expander("Renderizacao dos Graficos", expanded=False):
+        st.dataframe(df_figuras.round(4), use_container_width=True, hide_index=True)
+        resumo = cache_figuras().resumo()
+        st.caption(
+            f"Cache de figuras: {resumo['Entradas']:,} graficos, "
+            f"{resumo['Taxa de acerto (%)']:.1f}% de acerto"
+        )
+
+def exibir_estatisticas_interacoes():
+    """Exibe na sidebar a latencia das execucoes completas x reexecucoes dos fragmentos."""
+    df_interacoes = estatisticas_interacoes().resumo()
+    if df_interacoes.empty:
+        return
+
+    with st.sidebar.expander("Latencia das Interacoes", expanded=False):
+        st.dataframe(df_interacoes.round(3), use_container_width=True, hide_index=True)
+        st.caption("Atualizada a cada execucao completa; as reexecucoes dos fragmentos nao redesenham a sidebar.")
+
+def exibir_memoria_caches():
+    """Exibe na sidebar a ocupacao atual dos caches LRU e a compactacao acumulada dos DataFrames."""
+    df_memoria = estatisticas_memoria().resumo()
+    if df_memoria.empty:
+        return
+
+    with st.sidebar.expander("Memoria dos Caches", expanded=False):
+        drilldowns = cache_drilldowns().resumo()['Memoria (MB)']
+        figuras = cache_figuras().resumo()['Memoria (MB)']
+        st.caption(f"Em memoria agora: drill-downs {drilldowns:.1f} MB | graficos {figuras:.1f} MB")
+        st.dataframe(df_memoria.round(2), use_container_width=True, hide_index=True)
+        antes = df_memoria['Antes (MB, acumulado)'].sum()
+        depois = df_memoria['Depois (MB, acumulado)'].sum()
+        st.caption(f"Compactacao acumulada desde o inicio do processo: {antes:.1f} MB -> {depois:.1f} MB")
+
+def exibir_tempos_carga(tempos):
+    """Exibe na sidebar o tempo de cada consulta da ultima carga."""
+    consultas = {chave: valor for chave, valor in tempos.items() if chave != '_total'}
+    if not consultas:
+        return
+
+    with st.sidebar.expander("Desempenho da Carga", expanded=False):
+        df_tempos = pd.DataFrame(
+            sorted(consultas.items(), key=lambda item: item[1], reverse=True),
+            columns=['Consulta', 'Tempo (s)']
+        )
+        st.dataframe(df_tempos.round(3), use_container_width=True, hide_index=True)
+        st.caption(f"Soma das consultas: {sum(consultas.values()):.2f}s")
+        st.caption(f"Consulta mais lenta: {max(consultas.values()):.2f}s")
+        st.caption(f"Tempo da carga: {tempos['_total']:.2f}s (ate {MAX_CONSULTAS_PARALELAS} em paralelo)")
+
 # =============================================================================
 # 7. PAGINAS DO DASHBOARD
 # =============================================================================
 
-def dashboard_executivo(dados, filtros):
+def dashboard_executivo(dados, filtros, engine):
     """Dashboard executivo principal."""
     st.markdown("<h1 class='main-header'>Dashboard Executivo GENESIS V6</h1>", unsafe_allow_html=True)
 
@@ -682,18 +2347,20 @@ def dashboard_executivo(dados, filtros):
 
     st.markdown("---")
 
-    # Graficos
+    # Graficos (montados uma vez por versao dos dados e tema; ver exibir_figura)
+    versao = versao_dados_atual(engine)
+    tema = filtros['tema']
     col1, col2 = st.columns(2)
 
     with col1:
         df_acao = dados.get('dist_acao', pd.DataFrame())
         if not df_acao.empty:
-            fig_acao = px.pie(
+            exibir_figura(versao, 'dashboard_acao', tema, lambda: px.pie(
                 df_acao,
                 values='qtd_empresas',
                 names='acao',
                 title='Distribuicao por Acao Fiscal',
-                template=filtros['tema'],
+                template=tema,
                 color='acao',
                 color_discrete_map={
                     'EXCLUSAO_COM_DEBITO': '#c62828',
@@ -701,24 +2368,26 @@ def dashboard_executivo(dados, filtros):
                     'SEM_INTERESSE': '#2e7d32'
                 },
                 hole=0.4
-            )
-            st.plotly_chart(fig_acao, use_container_width=True)
+            ))
 
     with col2:
         df_inciso = dados.get('dist_inciso', pd.DataFrame())
         if not df_inciso.empty:
-            fig_inciso = px.bar(
-                df_inciso,
-                x='tipo_inciso',
-                y='qtd_grupos',
-                title='Distribuicao por Tipo de Inciso (LC 123)',
-                template=filtros['tema'],
-                text='qtd_grupos',
-                color='credito_total',
-                color_continuous_scale='Reds'
-            )
-            fig_inciso.update_traces(textposition='outside')
-            st.plotly_chart(fig_inciso, use_container_width=True)
+            def figura_inciso():
+                fig_inciso = px.bar(
+                    df_inciso,
+                    x='tipo_inciso',
+                    y='qtd_grupos',
+                    title='Distribuicao por Tipo de Inciso (LC 123)',
+                    template=tema,
+                    text='qtd_grupos',
+                    color='credito_total',
+                    color_continuous_scale='Reds'
+                )
+                fig_inciso.update_traces(textposition='outside')
+                return fig_inciso
+
+            exibir_figura(versao, 'dashboard_inciso', tema, figura_inciso)
 
     # Distribuicao Geografica
     st.markdown("<div class='sub-header'>Distribuicao Geografica</div>", unsafe_allow_html=True)
@@ -728,55 +2397,64 @@ def dashboard_executivo(dados, filtros):
         col1, col2 = st.columns(2)
 
         with col1:
-            df_uf_top = df_uf.head(15)
-            fig_uf_empresas = px.bar(
-                df_uf_top,
-                x='uf',
-                y='qtd_empresas',
-                title='Estados por Quantidade de Empresas',
-                template=filtros['tema'],
-                text='qtd_empresas',
-                color='qtd_empresas',
-                color_continuous_scale='Blues'
-            )
-            fig_uf_empresas.update_traces(textposition='outside')
-            st.plotly_chart(fig_uf_empresas, use_container_width=True)
+            def figura_uf_empresas():
+                df_uf_top = df_uf.head(15)
+                fig_uf_empresas = px.bar(
+                    df_uf_top,
+                    x='uf',
+                    y='qtd_empresas',
+                    title='Estados por Quantidade de Empresas',
+                    template=tema,
+                    text='qtd_empresas',
+                    color='qtd_empresas',
+                    color_continuous_scale='Blues'
+                )
+                fig_uf_empresas.update_traces(textposition='outside')
+                return fig_uf_empresas
+
+            exibir_figura(versao, 'dashboard_uf_empresas', tema, figura_uf_empresas)
 
         with col2:
-            df_uf_credito = df_uf[df_uf['credito_total'] > 0].head(15)
-            fig_uf_credito = px.bar(
-                df_uf_credito,
-                x='uf',
-                y='credito_total',
-                title='Estados por Credito Tributario',
-                template=filtros['tema'],
-                text='credito_total',
-                color='credito_total',
-                color_continuous_scale='Reds'
-            )
-            fig_uf_credito.update_traces(textposition='outside', texttemplate='R$ %{text:,.0f}')
-            st.plotly_chart(fig_uf_credito, use_container_width=True)
+            def figura_uf_credito():
+                df_uf_credito = df_uf[df_uf['credito_total'] > 0].head(15)
+                fig_uf_credito = px.bar(
+                    df_uf_credito,
+                    x='uf',
+                    y='credito_total',
+                    title='Estados por Credito Tributario',
+                    template=tema,
+                    text='credito_total',
+                    color='credito_total',
+                    color_continuous_scale='Reds'
+                )
+                fig_uf_credito.update_traces(textposition='outside', texttemplate='R$ %{text:,.0f}')
+                return fig_uf_credito
+
+            exibir_figura(versao, 'dashboard_uf_credito', tema, figura_uf_credito)
 
     # Periodos
     st.markdown("<div class='sub-header'>Distribuicao por Periodo</div>", unsafe_allow_html=True)
 
     df_periodo = dados.get('dist_periodo', pd.DataFrame())
     if not df_periodo.empty:
-        fig_periodo = px.bar(
-            df_periodo.head(10),
-            x='flag_periodo',
-            y='qtd_grupos',
-            title='Top 10 Periodos com Irregularidades',
-            template=filtros['tema'],
-            text='qtd_grupos',
-            color='credito_total',
-            color_continuous_scale='Oranges'
-        )
-        fig_periodo.update_traces(textposition='outside')
-        st.plotly_chart(fig_periodo, use_container_width=True)
-
+        def figura_periodo():
+            fig_periodo = px.bar(
+                df_periodo.head(10),
+                x='flag_periodo',
+                y='qtd_grupos',
+                title='Top 10 Periodos com Irregularidades',
+                template=tema,
+                text='qtd_grupos',
+                color='credito_total',
+                color_continuous_scale='Oranges'
+            )
+            fig_periodo.update_traces(textposition='outside')
+            return fig_periodo
+
+        exibir_figura(versao, 'dashboard_periodo', tema, figura_periodo)
+
 
-def ranking_grupos(dados, filtros):
+def ranking_grupos(dados, filtros, engine):
     """Ranking de grupos por credito tributario."""
     st.markdown("<h1 class='main-header'>Ranking de Grupos Economicos</h1>", unsafe_allow_html=True)
 
@@ -788,6 +2466,12 @@ def ranking_grupos(dados, filtros):
     </div>
     """, unsafe_allow_html=True)
 
+    secao_ranking(filtros, engine)
+
+
+@fragmento_medido('Ranking de Grupos')
+def secao_ranking(filtros, engine):
+    """Filtros, tabela e graficos do ranking (fragmento)."""
     # Configuracoes
     st.subheader("Configuracoes do Ranking")
 
@@ -799,7 +2483,7 @@ def ranking_grupos(dados, filtros):
     with col2:
         filtro_acao = st.multiselect(
             "Filtrar por Acao",
-            ['EXCLUSAO_COM_DEBITO', 'EXCLUSAO_SEM_DEBITO', 'SEM_INTERESSE'],
+            ACOES_FISCAIS,
             default=['EXCLUSAO_COM_DEBITO'],
             key='filtro_acao_rank'
         )
@@ -822,32 +2506,28 @@ def ranking_grupos(dados, filtros):
             key='min_empresas'
         )
 
-    df_top = dados.get('top_grupos', pd.DataFrame())
+    # Filtros e Top N aplicados no banco sobre todos os grupos
+    with st.spinner('Calculando ranking...'):
+        df_top = carregar_ranking_grupos(
+            engine,
+            acoes=tuple(sorted(filtro_acao)),
+            min_credito=min_credito,
+            min_empresas=min_empresas,
+            limite=top_n
+        )
 
     if df_top.empty:
-        st.warning("Dados nao carregados.")
+        st.warning("Nenhum grupo encontrado com os filtros aplicados.")
         return
 
-    # Filtrar
-    if min_credito > 0:
-        df_top = df_top[df_top['vl_ct_total'] >= min_credito]
-
-    if min_empresas > 2:
-        df_top = df_top[df_top['qte_cnpj'] >= min_empresas]
-
-    if filtro_acao:
-        df_top = df_top[df_top['acao_principal'].isin(filtro_acao)]
-
-    df_top = df_top.head(top_n)
-
     # Formatar para exibicao
     df_display = df_top.copy()
     df_display['posicao'] = range(1, len(df_display) + 1)
-    df_display['cpf_formatado'] = df_display['cpf'].apply(formatar_cpf)
-    df_display['vl_ct_formatado'] = df_display['vl_ct_total'].apply(formatar_moeda)
-    df_display['receita_formatada'] = df_display['receita_maxima'].apply(formatar_moeda)
-    df_display['acao_badge'] = df_display['acao_principal'].apply(criar_badge_acao)
-    df_display['inciso_badge'] = df_display['tipo_inciso'].apply(criar_badge_inciso)
+    df_display['cpf_formatado'] = formatar_cpf_coluna(df_display['cpf'])
+    df_display['vl_ct_formatado'] = formatar_moeda_coluna(df_display['vl_ct_total'])
+    df_display['receita_formatada'] = formatar_moeda_coluna(df_display['receita_maxima'])
+    df_display['acao_badge'] = criar_badge_acao_coluna(df_display['acao_principal'])
+    df_display['inciso_badge'] = criar_badge_inciso_coluna(df_display['tipo_inciso'])
 
     # Estatisticas do filtro
     st.markdown("---")
@@ -904,69 +2584,113 @@ def ranking_grupos(dados, filtros):
     st.markdown("---")
     st.subheader("Visualizacoes")
 
+    # Os graficos dependem apenas dos filtros do ranking (e do tema)
+    versao = versao_dados_atual(engine)
+    tema = filtros['tema']
+    parametros_ranking = {
+        'acoes': tuple(sorted(filtro_acao)),
+        'min_credito': min_credito,
+        'min_empresas': min_empresas,
+        'top_n': top_n
+    }
     col1, col2 = st.columns(2)
 
     with col1:
-        df_top_20 = df_display.head(20)
+        def figura_credito():
+            df_top_20 = df_display.head(20)
+
+            fig_credito = go.Figure()
+
+            fig_credito.add_trace(go.Bar(
+                x=df_top_20['vl_ct_total'],
+                y=df_top_20['num_grupo'].astype(str),
+                orientation='h',
+                text=formatar_moeda_coluna(df_top_20['vl_ct_total']),
+                textposition='outside',
+                marker_color='#c62828',
+                hovertemplate='<b>Grupo %{y}</b><br>Credito: %{text}<extra></extra>'
+            ))
+
+            fig_credito.update_layout(
+                title='Top 20 Grupos por Credito Tributario',
+                xaxis_title='Credito Tributario (R$)',
+                yaxis_title='Numero do Grupo',
+                template=tema,
+                height=600
+            )
+            return fig_credito
 
-        fig_credito = go.Figure()
+        exibir_figura(versao, 'ranking_credito', tema, figura_credito, **parametros_ranking)
 
-        fig_credito.add_trace(go.Bar(
-            x=df_top_20['vl_ct_total'],
-            y=df_top_20['num_grupo'].astype(str),
-            orientation='h',
-            text=df_top_20['vl_ct_total'].apply(lambda x: formatar_moeda(x)),
-            textposition='outside',
-            marker_color='#c62828',
-            hovertemplate='<b>Grupo %{y}</b><br>Credito: %{text}<extra></extra>'
-        ))
+    with col2:
+        def figura_scatter():
+            fig_scatter = px.scatter(
+                df_display,
+                x='empresas_grupo',
+                y='vl_ct_total',
+                size='receita_maxima',
+                color='acao_principal',
+                hover_name='num_grupo',
+                title='Credito x Quantidade de Empresas',
+                template=tema,
+                color_discrete_map={
+                    'EXCLUSAO_COM_DEBITO': '#c62828',
+                    'EXCLUSAO_SEM_DEBITO': '#ef6c00',
+                    'SEM_INTERESSE': '#2e7d32'
+                },
+                labels={
+                    'empresas_grupo': 'Quantidade de Empresas',
+                    'vl_ct_total': 'Credito Tributario (R$)',
+                    'acao_principal': 'Acao'
+                }
+            )
 
-        fig_credito.update_layout(
-            title='Top 20 Grupos por Credito Tributario',
-            xaxis_title='Credito Tributario (R$)',
-            yaxis_title='Numero do Grupo',
-            template=filtros['tema'],
-            height=600
-        )
+            fig_scatter.update_layout(height=600)
+            return fig_scatter
 
-        st.plotly_chart(fig_credito, use_container_width=True)
+        exibir_figura(versao, 'ranking_dispersao', tema, figura_scatter, **parametros_ranking)
 
-    with col2:
-        fig_scatter = px.scatter(
-            df_display,
-            x='empresas_grupo',
-            y='vl_ct_total',
-            size='receita_maxima',
-            color='acao_principal',
-            hover_name='num_grupo',
-            title='Credito x Quantidade de Empresas',
-            template=filtros['tema'],
-            color_discrete_map={
-                'EXCLUSAO_COM_DEBITO': '#c62828',
-                'EXCLUSAO_SEM_DEBITO': '#ef6c00',
-                'SEM_INTERESSE': '#2e7d32'
-            },
-            labels={
-                'empresas_grupo': 'Quantidade de Empresas',
-                'vl_ct_total': 'Credito Tributario (R$)',
-                'acao_principal': 'Acao'
-            }
-        )
 
-        fig_scatter.update_layout(height=600)
-        st.plotly_chart(fig_scatter, use_container_width=True)
+# Colunas usadas pela Analise de Grupo (cabecalho, KPIs, tabela e download)
+COLUNAS_ANALISE_GRUPO = (
+    'num_grupo', 'cpf', 'qte_cnpj', 'cnpj_raiz', 'razao_social', 'uf',
+    'situacao_cadastral', 'acao', 'vl_ct', 'receita_pa_fato',
+    'flag_periodo', 'emite_te_sc', 'tipo_inciso'
+)
 
+def csv_grupos_completos(engine, versao, grupos, formatados=False):
+    """CSV com todas as colunas das empresas dos grupos, gerado so quando o download e pedido.
+
+    A tela projeta apenas COLUNAS_ANALISE_GRUPO; o arquivo exportado mantem a
+    tabela inteira. Roda fora do rerun do script, por isso nao usa elementos st.*.
+    """
+    df = executar_consulta(engine, 'detalhes_grupos', None, versao, grupos=[int(num_grupo) for num_grupo in grupos])
+    if not df.empty:
+        df, _ = deduplicar_empresas(df, ('num_grupo', 'cnpj_raiz'))
+        if formatados:
+            df['cnpj_formatado'] = formatar_cnpj_coluna(df['cnpj_raiz'])
+            df['vl_ct_formatado'] = formatar_moeda_coluna(df['vl_ct'])
+            df['receita_formatada'] = formatar_moeda_coluna(df['receita_pa_fato'])
+            df['acao_badge'] = criar_badge_acao_coluna(df['acao'])
+    return expandir_chaves(df).to_csv(index=False).encode('utf-8-sig')
 
 def analise_detalhada_grupo(dados, filtros, engine):
     """Analise detalhada de um grupo especifico."""
     st.markdown("<h1 class='main-header'>Analise Detalhada - Grupo Economico</h1>", unsafe_allow_html=True)
 
     lista_grupos = dados.get('lista_grupos', pd.DataFrame())
+    df_top = dados.get('top_grupos', pd.DataFrame())
 
     if lista_grupos.empty:
         st.warning("Lista de grupos nao carregada.")
         return
 
+    secao_analise_grupo(lista_grupos, df_top, engine)
+
+
+@fragmento_medido('Analise de Grupo')
+def secao_analise_grupo(lista_grupos, df_top, engine):
+    """Busca, selecao e detalhe do grupo (fragmento)."""
     # Selecao do grupo
     st.subheader("Selecao do Grupo")
 
@@ -979,35 +2703,38 @@ def analise_detalhada_grupo(dados, filtros, engine):
             key='busca_grupo'
         )
 
-        if busca_grupo:
-            lista_filtrada = lista_grupos[
-                (lista_grupos['num_grupo'].astype(str).str.contains(busca_grupo, na=False)) |
-                (lista_grupos['cpf'].astype(str).str.contains(busca_grupo.replace('.', '').replace('-', ''), na=False))
-            ]
-        else:
-            lista_filtrada = lista_grupos
+        # Busca por prefixo do numero do grupo ou do CPF no indice em cache
+        indice = indice_busca_grupos(lista_grupos, versao_dados_atual(engine))
+        grupos_encontrados, total_encontrados = indice.buscar(busca_grupo)
 
         num_grupo_selecionado = st.selectbox(
             "Selecione o grupo:",
-            lista_filtrada['num_grupo'].tolist(),
-            format_func=lambda x: f"Grupo {x} - {lista_filtrada[lista_filtrada['num_grupo']==x]['qte_cnpj'].iloc[0]} empresas",
+            grupos_encontrados,
+            format_func=indice.rotulo,
             key='select_grupo_detalhes'
         )
 
     with col2:
-        st.metric("Grupos Disponiveis", len(lista_filtrada))
+        st.metric("Grupos Disponiveis", total_encontrados)
+
+    if total_encontrados > len(grupos_encontrados):
+        st.caption(f"Mostrando os primeiros {len(grupos_encontrados):,} grupos. Refine a busca para ver os demais.")
 
     if not num_grupo_selecionado:
         st.info("Selecione um grupo para analise.")
         return
 
+    # Busca em segundo plano o grupo destacado e os proximos do ranking, para
+    # que o clique em "Carregar Analise Completa" seja servido pelo cache
+    pre_carregador().agendar(engine, grupos_para_precarregar(num_grupo_selecionado, df_top))
+
     if st.button("Carregar Analise Completa", type="primary", use_container_width=True):
         st.session_state.analise_carregada = True
         st.session_state.num_grupo_atual = num_grupo_selecionado
 
     if st.session_state.get('analise_carregada', False) and st.session_state.get('num_grupo_atual') == num_grupo_selecionado:
         with st.spinner(f'Carregando dados do Grupo {num_grupo_selecionado}...'):
-            df_grupo = carregar_detalhes_grupo(engine, num_grupo_selecionado)
+            df_grupo = carregar_detalhes_grupo(engine, num_grupo_selecionado, COLUNAS_ANALISE_GRUPO)
 
         if df_grupo.empty:
             st.error("Grupo nao encontrado.")
@@ -1077,10 +2804,10 @@ def analise_detalhada_grupo(dados, filtros, engine):
         st.markdown("<div class='sub-header'>Empresas do Grupo</div>", unsafe_allow_html=True)
 
         df_empresas = df_grupo.copy()
-        df_empresas['cnpj_formatado'] = df_empresas['cnpj_raiz'].apply(formatar_cnpj)
-        df_empresas['vl_ct_formatado'] = df_empresas['vl_ct'].apply(formatar_moeda)
-        df_empresas['receita_formatada'] = df_empresas['receita_pa_fato'].apply(formatar_moeda)
-        df_empresas['acao_badge'] = df_empresas['acao'].apply(criar_badge_acao)
+        df_empresas['cnpj_formatado'] = formatar_cnpj_coluna(df_empresas['cnpj_raiz'])
+        df_empresas['vl_ct_formatado'] = formatar_moeda_coluna(df_empresas['vl_ct'])
+        df_empresas['receita_formatada'] = formatar_moeda_coluna(df_empresas['receita_pa_fato'])
+        df_empresas['acao_badge'] = criar_badge_acao_coluna(df_empresas['acao'])
 
         st.dataframe(
             df_empresas[[
@@ -1103,27 +2830,217 @@ def analise_detalhada_grupo(dados, filtros, engine):
             height=500
         )
 
-        # Download
-        csv = df_empresas.to_csv(index=False).encode('utf-8-sig')
+        # Download (todas as colunas, consultadas apenas ao clicar)
         st.download_button(
             "Download CSV",
-            csv,
+            functools.partial(
+                csv_grupos_completos, engine, versao_dados_atual(engine), [num_grupo_selecionado], formatados=True
+            ),
             f"grupo_{num_grupo_selecionado}_empresas.csv",
             "text/csv",
             key='download_grupo'
         )
 
 
+# Maximo de grupos por comparacao (os que faltam no cache vem em uma consulta)
+LIMITE_GRUPOS_COMPARACAO = 20
+
+def comparacao_grupos(dados, filtros, engine):
+    """Comparacao lado a lado de varios grupos economicos."""
+    st.markdown("<h1 class='main-header'>Comparacao de Grupos</h1>", unsafe_allow_html=True)
+
+    lista_grupos = dados.get('lista_grupos', pd.DataFrame())
+    df_top = dados.get('top_grupos', pd.DataFrame())
+
+    if lista_grupos.empty:
+        st.warning("Lista de grupos nao carregada.")
+        return
+
+    secao_comparacao(lista_grupos, df_top, filtros, engine)
+
+
+@fragmento_medido('Comparacao de Grupos')
+def secao_comparacao(lista_grupos, df_top, filtros, engine):
+    """Busca, selecao e comparacao dos grupos (fragmento)."""
+    # Selecao dos grupos (inicia com os 5 maiores creditos)
+    st.subheader("Selecao dos Grupos")
+
+    indice = indice_busca_grupos(lista_grupos, versao_dados_atual(engine))
+    if 'grupos_comparacao' not in st.session_state:
+        st.session_state.grupos_comparacao = df_top['num_grupo'].head(5).tolist() if not df_top.empty else []
+
+    busca = st.text_input(
+        "Buscar por Numero ou CPF",
+        placeholder="Digite o numero do grupo ou CPF do socio para incluir na comparacao...",
+        key='busca_grupo_comparacao'
+    )
+    encontrados, _ = indice.buscar(busca)
+    opcoes = list(dict.fromkeys(st.session_state.grupos_comparacao + encontrados))
+
+    grupos = st.multiselect(
+        f"Grupos para comparar (ate {LIMITE_GRUPOS_COMPARACAO}):",
+        opcoes,
+        format_func=indice.rotulo,
+        max_selections=LIMITE_GRUPOS_COMPARACAO,
+        key='grupos_comparacao'
+    )
+
+    if len(grupos) < 2:
+        st.info("Selecione ao menos dois grupos para comparar.")
+        return
+
+    with st.spinner(f'Carregando {len(grupos)} grupos...'):
+        inicio = time.perf_counter()
+        df_grupos, qtd_cache = carregar_detalhes_grupos(engine, grupos, COLUNAS_ANALISE_GRUPO)
+        tempo_carga = time.perf_counter() - inicio
+
+    if df_grupos.empty:
+        st.error("Nenhum dado encontrado para os grupos selecionados.")
+        return
+
+    st.caption(
+        f"{len(grupos)} grupos: {qtd_cache} do cache, {len(grupos) - qtd_cache} em uma unica consulta "
+        f"| {tempo_carga:.2f}s"
+    )
+
+    # Matriz de indicadores (um grupo por linha)
+    st.markdown("<div class='sub-header'>Indicadores por Grupo</div>", unsafe_allow_html=True)
+
+    matriz = df_grupos.assign(
+        empresa_sc=df_grupos['uf'] == 'SC',
+        te_sc=df_grupos['emite_te_sc'] == 'S',
+        com_debito=df_grupos['vl_ct'] > 0
+    ).groupby('num_grupo').agg(
+        cpf=('cpf', 'first'),
+        empresas=('cnpj_raiz', 'size'),
+        empresas_sc=('empresa_sc', 'sum'),
+        empresas_debito=('com_debito', 'sum'),
+        emite_te=('te_sc', 'sum'),
+        estados=('uf', 'nunique'),
+        credito_total=('vl_ct', 'sum'),
+        receita_maxima=('receita_pa_fato', 'max'),
+        tipo_inciso=('tipo_inciso', 'first')
+    ).reset_index().sort_values('credito_total', ascending=False)
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("Grupos", len(matriz))
+
+    with col2:
+        st.metric("Empresas", f"{matriz['empresas'].sum():,}")
+
+    with col3:
+        st.metric("Credito Total", formatar_moeda(matriz['credito_total'].sum()))
+
+    with col4:
+        st.metric("Acima do Limite SN", int((matriz['receita_maxima'] > 4800000).sum()))
+
+    df_display = matriz.copy()
+    df_display['cpf_formatado'] = formatar_cpf_coluna(df_display['cpf'])
+    df_display['credito_formatado'] = formatar_moeda_coluna(df_display['credito_total'])
+    df_display['receita_formatada'] = formatar_moeda_coluna(df_display['receita_maxima'])
+    df_display['inciso_badge'] = criar_badge_inciso_coluna(df_display['tipo_inciso'])
+
+    st.dataframe(
+        df_display[[
+            'num_grupo', 'cpf_formatado', 'empresas', 'empresas_sc', 'empresas_debito',
+            'emite_te', 'estados', 'credito_formatado', 'receita_formatada', 'inciso_badge'
+        ]].rename(columns={
+            'num_grupo': 'Grupo',
+            'cpf_formatado': 'CPF',
+            'empresas': 'Empresas',
+            'empresas_sc': 'SC',
+            'empresas_debito': 'Com Debito',
+            'emite_te': 'TEs',
+            'estados': 'UFs',
+            'credito_formatado': 'Credito Total',
+            'receita_formatada': 'Receita Maxima',
+            'inciso_badge': 'Inciso'
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    # Graficos
+    col1, col2 = st.columns(2)
+
+    with col1:
+        fig_credito = go.Figure(go.Bar(
+            x=matriz['credito_total'],
+            y=matriz['num_grupo'].astype(str),
+            orientation='h',
+            text=formatar_moeda_coluna(matriz['credito_total']),
+            textposition='outside',
+            marker_color='#c62828',
+            hovertemplate='<b>Grupo %{y}</b><br>Credito: %{text}<extra></extra>'
+        ))
+        fig_credito.update_layout(
+            title='Credito Tributario por Grupo',
+            xaxis_title='Credito Tributario (R$)',
+            yaxis_title='Numero do Grupo',
+            yaxis={'autorange': 'reversed'},
+            template=filtros['tema'],
+            height=500
+        )
+        st.plotly_chart(fig_credito, use_container_width=True)
+
+    with col2:
+        fig_receita = go.Figure(go.Bar(
+            x=matriz['receita_maxima'],
+            y=matriz['num_grupo'].astype(str),
+            orientation='h',
+            text=formatar_moeda_coluna(matriz['receita_maxima']),
+            textposition='outside',
+            marker_color='#1565c0',
+            hovertemplate='<b>Grupo %{y}</b><br>Receita: %{text}<extra></extra>'
+        ))
+        fig_receita.add_vline(
+            x=4800000,
+            line_dash='dash',
+            line_color='#c62828',
+            annotation_text='Limite SN'
+        )
+        fig_receita.update_layout(
+            title='Receita Maxima por Grupo',
+            xaxis_title='Receita (R$)',
+            yaxis_title='Numero do Grupo',
+            yaxis={'autorange': 'reversed'},
+            template=filtros['tema'],
+            height=500
+        )
+        st.plotly_chart(fig_receita, use_container_width=True)
+
+    # Download (todas as colunas, consultadas apenas ao clicar)
+    st.download_button(
+        "Download CSV (empresas dos grupos)",
+        functools.partial(csv_grupos_completos, engine, versao_dados_atual(engine), list(grupos)),
+        "comparacao_grupos.csv",
+        "text/csv",
+        key='download_comparacao'
+    )
+
+
+# Colunas usadas pela Analise de Empresa (cabecalho, KPIs e status)
+COLUNAS_ANALISE_EMPRESA = (
+    'num_grupo', 'cnpj_raiz', 'razao_social', 'uf', 'situacao_cadastral',
+    'acao', 'vl_ct', 'receita_pa_fato', 'flag_periodo', 'dt_fato',
+    'emite_te_sc', 'tipo_inciso'
+)
+
 def analise_detalhada_empresa(dados, filtros, engine):
     """Analise detalhada de uma empresa especifica."""
     st.markdown("<h1 class='main-header'>Analise Detalhada - Empresa</h1>", unsafe_allow_html=True)
 
-    lista_empresas = dados.get('lista_empresas', pd.DataFrame())
+    df_uf = dados.get('dist_uf', pd.DataFrame())
+    ufs = sorted(df_uf['uf'].dropna().tolist()) if not df_uf.empty else []
+
+    secao_busca_empresas(ufs, engine)
 
-    if lista_empresas.empty:
-        st.warning("Lista de empresas nao carregada.")
-        return
 
+@fragmento_medido('Analise de Empresa')
+def secao_busca_empresas(ufs, engine):
+    """Busca paginada, selecao e detalhe da empresa (fragmento)."""
     # Selecao da empresa
     st.subheader("Selecao da Empresa")
 
@@ -1139,36 +3056,56 @@ def analise_detalhada_empresa(dados, filtros, engine):
     with col2:
         filtro_uf = st.selectbox(
             "Estado",
-            ['Todos'] + sorted(lista_empresas['uf'].unique().tolist()),
+            ['Todos'] + ufs,
             key='filtro_uf_empresa'
         )
 
-    # Filtrar lista
-    lista_filtrada = lista_empresas.copy()
-
-    if busca:
-        mascara_razao = lista_filtrada['razao_social'].str.contains(busca, case=False, na=False)
-        mascara_cnpj = lista_filtrada['cnpj_raiz'].astype(str).str.contains(busca.replace('.', '').replace('/', '').replace('-', ''), na=False)
-        lista_filtrada = lista_filtrada[mascara_razao | mascara_cnpj]
+    # Paginacao por chave: a pilha guarda o cursor de inicio de cada pagina
+    # visitada e e reiniciada quando a busca ou o estado mudam
+    filtro_atual = (busca, filtro_uf)
+    if st.session_state.get('busca_empresas_filtro') != filtro_atual:
+        st.session_state.busca_empresas_filtro = filtro_atual
+        st.session_state.busca_empresas_cursores = [None]
+    cursores = st.session_state.busca_empresas_cursores
 
-    if filtro_uf != 'Todos':
-        lista_filtrada = lista_filtrada[lista_filtrada['uf'] == filtro_uf]
+    with st.spinner('Buscando empresas...'):
+        df_pagina = buscar_empresas(engine, busca, filtro_uf, cursores[-1])
 
-    if len(lista_filtrada) > 1000:
-        st.warning(f"{len(lista_filtrada):,} empresas encontradas. Mostrando apenas as primeiras 1.000.")
-        lista_filtrada = lista_filtrada.head(1000)
+    tem_proxima = len(df_pagina) > TAMANHO_PAGINA_EMPRESAS
+    df_pagina = df_pagina.head(TAMANHO_PAGINA_EMPRESAS)
 
-    if lista_filtrada.empty:
+    if df_pagina.empty:
         st.info("Nenhuma empresa encontrada com os filtros aplicados.")
         return
 
-    st.caption(f"{len(lista_filtrada):,} empresas disponiveis")
+    col1, col2, col3 = st.columns([1, 2, 1])
+
+    with col1:
+        st.button(
+            "Pagina anterior",
+            disabled=len(cursores) == 1,
+            on_click=cursores.pop,
+            key='empresas_pagina_anterior'
+        )
+
+    with col2:
+        st.caption(f"Pagina {len(cursores)} | {len(df_pagina):,} empresas nesta pagina")
+
+    with col3:
+        ultima = df_pagina.iloc[-1]
+        st.button(
+            "Proxima pagina",
+            disabled=not tem_proxima,
+            on_click=cursores.append,
+            args=((ultima['razao_social'], ultima['cnpj_raiz']),),
+            key='empresas_proxima_pagina'
+        )
 
-    empresa_dict = dict(zip(lista_filtrada['cnpj_raiz'], lista_filtrada['razao_social']))
+    empresa_dict = dict(zip(df_pagina['cnpj_raiz'], df_pagina['razao_social']))
 
     cnpj_selecionado = st.selectbox(
         "Selecione a empresa:",
-        lista_filtrada['cnpj_raiz'].tolist(),
+        df_pagina['cnpj_raiz'].tolist(),
         format_func=lambda x: f"{formatar_cnpj(x)} - {empresa_dict.get(x, 'N/A')}",
         key='select_empresa_drill'
     )
@@ -1179,7 +3116,7 @@ def analise_detalhada_empresa(dados, filtros, engine):
 
     if st.button("Carregar Analise Completa", type="primary", use_container_width=True):
         with st.spinner(f'Carregando dados da empresa {formatar_cnpj(cnpj_selecionado)}...'):
-            df_empresa = carregar_detalhes_empresa(engine, cnpj_selecionado)
+            df_empresa = carregar_detalhes_empresa(engine, cnpj_selecionado, COLUNAS_ANALISE_EMPRESA)
 
         if df_empresa.empty:
             st.error("Empresa nao encontrada.")
@@ -1245,6 +3182,252 @@ def analise_detalhada_empresa(dados, filtros, engine):
             """, unsafe_allow_html=True)
 
 
+def ler_arquivo_identificadores(arquivo):
+    """Le o CSV enviado: separador pela primeira linha e cabecalho so se ela nao tiver digitos."""
+    conteudo = arquivo.getvalue().decode('utf-8-sig', errors='replace')
+    primeira_linha = conteudo.splitlines()[0] if conteudo.strip() else ''
+    separador = next((sep for sep in (';', '\t', '|', ',') if sep in primeira_linha), ';')
+    tem_cabecalho = not any(caractere.isdigit() for caractere in primeira_linha)
+
+    df = pd.read_csv(
+        io.StringIO(conteudo),
+        sep=separador,
+        dtype=str,
+        keep_default_na=False,
+        header=0 if tem_cabecalho else None
+    )
+    if not tem_cabecalho:
+        df.columns = [f"Coluna {i + 1}" for i in range(len(df.columns))]
+    return df
+
+def consulta_em_lote(dados, filtros, engine):
+    """Consulta de uma lista de CPFs/CNPJs enviada em arquivo CSV."""
+    st.markdown("<h1 class='main-header'>Consulta em Lote - CPF/CNPJ</h1>", unsafe_allow_html=True)
+
+    st.markdown("""
+    <div class='info-box'>
+        <strong>Como usar:</strong><br>
+        Envie um arquivo CSV com uma coluna de CPFs ou CNPJs, com ou sem mascara.
+        Identificadores com ate 8 digitos sao tratados como CNPJ raiz, com 9 a 11 como CPF
+        e com 12 a 14 como CNPJ completo (reduzido a raiz).
+    </div>
+    """, unsafe_allow_html=True)
+
+    arquivo = st.file_uploader("Arquivo CSV", type=['csv', 'txt'], key='arquivo_lote')
+    if arquivo is None:
+        st.info("Envie um arquivo para iniciar a consulta.")
+        return
+
+    try:
+        df_arquivo = ler_arquivo_identificadores(arquivo)
+    except Exception as e:
+        st.error(f"Erro ao ler o arquivo: {e}")
+        return
+
+    if df_arquivo.empty:
+        st.warning("O arquivo nao possui linhas.")
+        return
+
+    coluna = st.selectbox("Coluna com os identificadores", list(df_arquivo.columns), key='coluna_lote')
+
+    df_ids = normalizar_identificadores(df_arquivo[coluna])
+    df_ids = df_ids[df_ids['identificador'] != ''].reset_index(drop=True)
+    st.caption(
+        f"{len(df_ids):,} identificadores: {(df_ids['tipo'] == 'CNPJ').sum():,} CNPJ, "
+        f"{(df_ids['tipo'] == 'CPF').sum():,} CPF, {(df_ids['tipo'] == 'INVALIDO').sum():,} invalidos"
+    )
+
+    # O resultado fica na sessao para sobreviver aos reruns (ex.: download)
+    origem = (arquivo.name, arquivo.size, coluna)
+    if st.button("Consultar", type="primary", use_container_width=True):
+        with st.spinner(f'Consultando {len(df_ids):,} identificadores...'):
+            inicio = time.perf_counter()
+            try:
+                df_resultado = consultar_identificadores(engine, df_ids)
+            except Exception as e:
+                st.error(f"Erro na consulta em lote: {e}")
+                return
+            st.session_state.resultado_lote = (origem, df_resultado, time.perf_counter() - inicio)
+
+    if st.session_state.get('resultado_lote', (None,))[0] != origem:
+        return
+    _, df_resultado, tempo_consulta = st.session_state.resultado_lote
+
+    df_resultado = df_resultado.assign(situacao=np.select(
+        [df_resultado['tipo'] == 'INVALIDO', df_resultado['num_grupo'].isna()],
+        ['Invalido', 'Nao encontrado'],
+        default='Encontrado'
+    ))
+    por_identificador = df_resultado.drop_duplicates('identificador')
+
+    # Indicadores
+    st.markdown("---")
+    col1, col2, col3, col4, col5 = st.columns(5)
+
+    with col1:
+        st.metric("Identificadores", f"{len(por_identificador):,}")
+
+    with col2:
+        st.metric("Encontrados", f"{(por_identificador['situacao'] == 'Encontrado').sum():,}")
+
+    with col3:
+        st.metric("Nao Encontrados", f"{(por_identificador['situacao'] == 'Nao encontrado').sum():,}")
+
+    with col4:
+        st.metric("Empresas", f"{df_resultado['cnpj_raiz'].nunique():,}")
+
+    with col5:
+        st.metric("Vazao", f"{len(df_ids) / max(tempo_consulta, 1e-9):,.0f} ids/s", delta=f"{tempo_consulta:.2f}s", delta_color="off")
+
+    # Tabela consolidada
+    encontrado = df_resultado['situacao'] == 'Encontrado'
+    df_display = df_resultado.copy()
+    df_display['cnpj_formatado'] = formatar_cnpj_coluna(df_display['cnpj_raiz'])
+    df_display['vl_ct_formatado'] = formatar_moeda_coluna(df_display['vl_ct']).where(encontrado, '')
+    df_display['acao_badge'] = criar_badge_acao_coluna(df_display['acao']).where(encontrado, '')
+    df_display['inciso_badge'] = criar_badge_inciso_coluna(df_display['tipo_inciso']).where(encontrado, '')
+    df_display['num_grupo'] = df_display['num_grupo'].astype('Int64')
+
+    st.dataframe(
+        df_display[[
+            'identificador', 'tipo', 'situacao', 'num_grupo', 'cnpj_formatado', 'razao_social',
+            'uf', 'acao_badge', 'vl_ct_formatado', 'inciso_badge'
+        ]].rename(columns={
+            'identificador': 'Identificador',
+            'tipo': 'Tipo',
+            'situacao': 'Situacao',
+            'num_grupo': 'Grupo',
+            'cnpj_formatado': 'CNPJ',
+            'razao_social': 'Razao Social',
+            'uf': 'UF',
+            'acao_badge': 'Acao',
+            'vl_ct_formatado': 'Credito',
+            'inciso_badge': 'Inciso'
+        }),
+        use_container_width=True,
+        hide_index=True,
+        height=500
+    )
+
+    csv = df_resultado.to_csv(index=False).encode('utf-8-sig')
+    st.download_button(
+        "Download CSV",
+        csv,
+        "consulta_em_lote.csv",
+        "text/csv",
+        key='download_lote'
+    )
+
+def exportacao_dados(dados, filtros, engine):
+    """Exportacao completa da tabela principal filtrada por UF, acao e periodo."""
+    st.markdown("<h1 class='main-header'>Exportacao de Dados</h1>", unsafe_allow_html=True)
+
+    st.markdown(f"""
+    <div class='info-box'>
+        <strong>Exportacao completa:</strong><br>
+        Todas as linhas de {TABELA_PRINCIPAL} que atendem aos filtros, lidas em lotes de
+        {LINHAS_POR_LOTE_EXPORTACAO:,} linhas e gravadas em um arquivo temporario compactado.
+        Os arquivos gerados ficam disponiveis por {VALIDADE_EXPORTACOES_HORAS} horas.
+    </div>
+    """, unsafe_allow_html=True)
+
+    df_uf = dados.get('dist_uf', pd.DataFrame())
+    ufs_disponiveis = sorted(df_uf['uf'].dropna().tolist()) if not df_uf.empty else []
+
+    col1, col2 = st.columns(2)
+    with col1:
+        ufs = st.multiselect("UF (vazio = todas)", ufs_disponiveis, key='exportacao_ufs')
+        acoes = st.multiselect(
+            "Acao fiscal (vazio = todas)",
+            ACOES_FISCAIS,
+            format_func=criar_badge_acao,
+            key='exportacao_acoes'
+        )
+    with col2:
+        col_ini, col_fin = st.columns(2)
+        with col_ini:
+            ano_inicial = st.number_input("Ano inicial", min_value=2000, max_value=2100, value=None, step=1, key='exportacao_ano_inicial')
+        with col_fin:
+            ano_final = st.number_input("Ano final", min_value=2000, max_value=2100, value=None, step=1, key='exportacao_ano_final')
+        formatos = [formato for formato in FORMATOS_EXPORTACAO if formato != 'parquet' or PARQUET_DISPONIVEL]
+        formato = st.radio(
+            "Formato",
+            formatos,
+            format_func=lambda formato: FORMATOS_EXPORTACAO[formato][0],
+            horizontal=True,
+            key='exportacao_formato'
+        )
+
+    colunas = st.multiselect(
+        "Colunas (vazio = todas)",
+        list(COLUNAS_TABELA_PRINCIPAL),
+        key='exportacao_colunas'
+    )
+
+    parametros = {
+        'ufs': tuple(ufs),
+        'acoes': tuple(acoes),
+        'ano_inicial': ano_inicial,
+        'ano_final': ano_final
+    }
+    origem = (tuple(sorted(parametros.items())), formato, tuple(colunas))
+
+    if st.button("Gerar Arquivo", type="primary", use_container_width=True):
+        try:
+            total = contar_linhas_exportacao(engine, **parametros)
+            barra = st.progress(0.0, text=f"Exportando {total:,} linhas...")
+
+            def progresso(linhas):
+                barra.progress(min(linhas / max(total, 1), 1.0), text=f"{linhas:,} de {total:,} linhas")
+
+            inicio = time.perf_counter()
+            caminho, linhas = exportar_tabela_principal(
+                engine, formato, colunas or None, progresso, **parametros
+            )
+            barra.empty()
+        except Exception as e:
+            st.error(f"Erro na exportacao: {e}")
+            return
+
+        # Apenas o arquivo mais recente de cada sessao e mantido
+        anterior = st.session_state.get('exportacao')
+        if anterior is not None and os.path.exists(anterior[1]):
+            os.remove(anterior[1])
+        st.session_state.exportacao = (origem, caminho, linhas, time.perf_counter() - inicio)
+
+    exportacao = st.session_state.get('exportacao')
+    if exportacao is None or exportacao[0] != origem:
+        return
+    _, caminho, linhas, segundos = exportacao
+    if not os.path.exists(caminho):
+        st.info("O arquivo expirou. Gere a exportacao novamente.")
+        return
+
+    st.markdown("---")
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("Linhas", f"{linhas:,}")
+
+    with col2:
+        st.metric("Arquivo", f"{os.path.getsize(caminho) / 1024 ** 2:,.1f} MB")
+
+    with col3:
+        st.metric("Tempo", f"{segundos:.1f}s")
+
+    with col4:
+        st.metric("Vazao", f"{linhas / max(segundos, 1e-9):,.0f} linhas/s")
+
+    _, extensao, tipo_mime = FORMATOS_EXPORTACAO[formato]
+    st.download_button(
+        f"Download {FORMATOS_EXPORTACAO[formato][0]}",
+        functools.partial(ler_arquivo_exportacao, caminho),
+        f"{TABELA_PRINCIPAL}{extensao}",
+        tipo_mime,
+        key='download_exportacao'
+    )
+
+
 def relatorio_executivo(dados, filtros):
     """Relatorio executivo para exportacao."""
     st.markdown("<h1 class='main-header'>Relatorio Executivo</h1>", unsafe_allow_html=True)
@@ -1329,9 +3512,9 @@ def relatorio_executivo(dados, filtros):
 
         df_top_50 = df_top.head(50).copy()
         df_top_50['ranking'] = range(1, len(df_top_50) + 1)
-        df_top_50['cpf_formatado'] = df_top_50['cpf'].apply(formatar_cpf)
-        df_top_50['credito_formatado'] = df_top_50['vl_ct_total'].apply(formatar_moeda)
-        df_top_50['receita_formatada'] = df_top_50['receita_maxima'].apply(formatar_moeda)
+        df_top_50['cpf_formatado'] = formatar_cpf_coluna(df_top_50['cpf'])
+        df_top_50['credito_formatado'] = formatar_moeda_coluna(df_top_50['vl_ct_total'])
+        df_top_50['receita_formatada'] = formatar_moeda_coluna(df_top_50['receita_maxima'])
 
         st.dataframe(
             df_top_50[[
@@ -1356,7 +3539,7 @@ def relatorio_executivo(dados, filtros):
         )
 
         # Download do Top 50
-        csv = df_top_50.to_csv(index=False).encode('utf-8-sig')
+        csv = expandir_chaves(df_top_50).to_csv(index=False).encode('utf-8-sig')
         st.download_button(
             "Download Top 50 (CSV)",
             csv,
@@ -1366,18 +3549,205 @@ def relatorio_executivo(dados, filtros):
         )
 
 
+def administrador_autenticado():
+    """Confirma a senha de administracao ([administracao] senha em secrets.toml) uma vez por sessao."""
+    if st.session_state.get('administrador', False):
+        return True
+
+    senha_administracao = st.secrets.get('administracao', {}).get('senha')
+    if not senha_administracao:
+        st.caption("Acoes administrativas desativadas: defina [administracao] senha em secrets.toml.")
+        return False
+
+    senha_input = st.text_input("Senha de administracao:", type="password", key='senha_administracao')
+    if not senha_input:
+        return False
+    if senha_input != senha_administracao:
+        st.error("Senha de administracao incorreta")
+        return False
+    st.session_state.administrador = True
+    return True
+
+def administracao(dados, filtros):
+    """Painel administrativo: caches do processo e dossies de grupos ja gerados."""
+    st.markdown("<h1 class='main-header'>Administracao</h1>", unsafe_allow_html=True)
+
+    st.markdown("""
+    <div class='info-box'>
+        <strong>Caches do servidor:</strong><br>
+        Valores acumulados desde o inicio do processo do Streamlit e compartilhados
+        por todas as sessoes.
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Drill-downs (cache LRU em memoria)
+    st.markdown("<div class='sub-header'>Cache de Drill-downs (memoria)</div>", unsafe_allow_html=True)
+    resumo_lru = cache_drilldowns().resumo()
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Entradas", f"{resumo_lru['Entradas']:,}")
+    with col2:
+        st.metric(
+            "Memoria",
+            f"{resumo_lru['Memoria (MB)']:.2f} MB",
+            delta=f"limite {resumo_lru['Limite (MB)']:.0f} MB",
+            delta_color="off"
+        )
+    with col3:
+        st.metric("Acertos", f"{resumo_lru['Acertos']:,}")
+    with col4:
+        st.metric("Falhas", f"{resumo_lru['Falhas']:,}")
+    with col5:
+        st.metric("Descartes (LRU)", f"{resumo_lru['Descartes']:,}")
+
+    st.progress(
+        min(resumo_lru['Memoria (MB)'] / resumo_lru['Limite (MB)'], 1.0) if resumo_lru['Limite (MB)'] else 0.0,
+        text=f"Taxa de acerto: {resumo_lru['Taxa de acerto (%)']:.1f}%"
+    )
+
+    # Cache em disco e coalescencia
+    st.markdown("<div class='sub-header'>Cache em Disco e Consultas</div>", unsafe_allow_html=True)
+    disco = cache_disco()
+    andamento = consultas_em_andamento()
+
+    col1, col2, col3, col4 = st.columns(4)
+    if disco is not None:
+        arquivos, ocupado = disco.uso()
+        with col1:
+            st.metric("Arquivos em disco", f"{arquivos:,}")
+        with col2:
+            st.metric("Disco", f"{ocupado / 1024 ** 2:.1f} MB", delta=f"limite {LIMITE_CACHE_DISCO_MB} MB", delta_color="off")
+        with col3:
+            st.metric("Acertos / Falhas (disco)", f"{disco.acertos:,} / {disco.falhas:,}")
+    else:
+        with col1:
+            st.metric("Cache em disco", "Desativado")
+    with col4:
+        st.metric("Consultas coalescidas", f"{andamento.coalescidas:,}", delta=f"{andamento.execucoes:,} executadas", delta_color="off")
+
+    # Pre-carregamento de grupos (Analise de Grupo)
+    st.markdown("<div class='sub-header'>Pre-carregamento de Grupos</div>", unsafe_allow_html=True)
+    precarga = pre_carregador()
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Agendados", f"{precarga.agendados:,}")
+    with col2:
+        st.metric("Descartados (fila cheia)", f"{precarga.descartados:,}", delta=f"fila max. {precarga.limite_pendentes}", delta_color="off")
+    with col3:
+        st.metric("Erros", f"{precarga.erros:,}")
+
+    # Latencia e memoria
+    st.markdown("<div class='sub-header'>Latencia das Consultas</div>", unsafe_allow_html=True)
+    df_latencia = estatisticas_consultas().resumo()
+    if df_latencia.empty:
+        st.info("Nenhuma consulta nomeada executada neste processo.")
+    else:
+        st.dataframe(df_latencia.round(3), use_container_width=True, hide_index=True)
+
+    st.markdown("<div class='sub-header'>Memoria dos Datasets Compactados (acumulada)</div>", unsafe_allow_html=True)
+    df_memoria = estatisticas_memoria().resumo()
+    if df_memoria.empty:
+        st.info("Nenhum dataset carregado neste processo.")
+    else:
+        st.dataframe(df_memoria.round(2), use_container_width=True, hide_index=True)
+
+    # Acoes que afetam todas as sessoes exigem a senha de administracao
+    if administrador_autenticado():
+        if st.button("Esvaziar cache de drill-downs", key='limpar_cache_drilldowns'):
+            cache_drilldowns().clear()
+            st.rerun()
+
+    # Dossies dos grupos com debito: gerados pelo comando `dossies` (pool de
+    # processos), fora do servidor; a pagina apenas lista e entrega os ZIPs
+    st.markdown("---")
+    st.markdown("<div class='sub-header'>Dossies dos Grupos com Debito</div>", unsafe_allow_html=True)
+    st.caption(
+        "Uma pasta por grupo EXCLUSAO_COM_DEBITO (empresas, composicao do credito e historico "
+        f"de receita) em um unico ZIP, gerado com `python BCADASTRO_V6.py dossies` em {DIRETORIO_DOSSIES}."
+    )
+
+    df_dossies = listar_dossies()
+    if df_dossies.empty:
+        st.info("Nenhum dossie gerado.")
+        return
+
+    st.dataframe(df_dossies.round(1), use_container_width=True, hide_index=True)
+
+    arquivo = st.selectbox("Dossie para download:", df_dossies['Arquivo'].tolist(), key='dossie_selecionado')
+    st.download_button(
+        "Download ZIP",
+        functools.partial(ler_arquivo_exportacao, os.path.join(DIRETORIO_DOSSIES, arquivo)),
+        arquivo,
+        "application/zip",
+        key='download_dossies'
+    )
+
+# Registro de paginas: funcao de renderizacao, datasets necessarios e se a
+# pagina consulta o banco diretamente (drill-down).
+PAGINAS = {
+    "Dashboard Executivo": {
+        'funcao': dashboard_executivo,
+        'datasets': ['resumo_geral', 'dist_acao', 'dist_inciso', 'dist_uf', 'dist_periodo'],
+        'usa_engine': True
+    },
+    "Ranking de Grupos": {
+        'funcao': ranking_grupos,
+        'datasets': [],
+        'usa_engine': True
+    },
+    "Analise de Grupo": {
+        'funcao': analise_detalhada_grupo,
+        'datasets': ['lista_grupos', 'top_grupos'],
+        'usa_engine': True
+    },
+    "Comparacao de Grupos": {
+        'funcao': comparacao_grupos,
+        'datasets': ['lista_grupos', 'top_grupos'],
+        'usa_engine': True
+    },
+    "Analise de Empresa": {
+        'funcao': analise_detalhada_empresa,
+        'datasets': ['dist_uf'],
+        'usa_engine': True
+    },
+    "Consulta em Lote": {
+        'funcao': consulta_em_lote,
+        'datasets': [],
+        'usa_engine': True
+    },
+    "Exportacao de Dados": {
+        'funcao': exportacao_dados,
+        'datasets': ['dist_uf'],
+        'usa_engine': True
+    },
+    "Relatorio Executivo": {
+        'funcao': relatorio_executivo,
+        'datasets': ['resumo_geral', 'dist_acao', 'dist_uf', 'top_grupos', 'dist_inciso'],
+        'usa_engine': False
+    },
+    "Administracao": {
+        'funcao': administracao,
+        'datasets': [],
+        'usa_engine': False
+    }
+}
+
 # =============================================================================
 # 8. FUNCAO PRINCIPAL
 # =============================================================================
 
 def main():
+    inicio_execucao = time.perf_counter()
+
     # Sidebar
     st.sidebar.title("Sistema GENESIS V6")
     st.sidebar.caption("Grupos Economicos e Simples Nacional")
     st.sidebar.markdown("---")
 
-    # Conectar ao banco
-    engine = get_impala_engine()
+    # Conectar ao banco (Impala ou snapshot local, conforme GENESIS_BACKEND)
+    engine = get_engine_dados()
 
     if engine is None:
         st.error("Falha na conexao com o banco de dados.")
@@ -1397,32 +3767,18 @@ def main():
     # Menu de navegacao
     st.sidebar.subheader("Navegacao")
 
-    paginas = [
-        "Dashboard Executivo",
-        "Ranking de Grupos",
-        "Analise de Grupo",
-        "Analise de Empresa",
-        "Relatorio Executivo"
-    ]
-
     pagina_selecionada = st.sidebar.radio(
         "Selecione uma pagina",
-        paginas,
+        list(PAGINAS),
         label_visibility="collapsed"
     )
+    pagina = PAGINAS[pagina_selecionada]
 
-    # Carregar dados agregados
+    # Carregar apenas os dados da pagina selecionada (o resumo geral vem da
+    # tabela agregada, uma leitura pequena, e alimenta a sidebar)
+    datasets = list(dict.fromkeys(['resumo_geral'] + pagina['datasets']))
     with st.spinner('Carregando dados do sistema...'):
-        dados = {
-            'resumo_geral': carregar_resumo_geral(engine),
-            'dist_acao': carregar_distribuicao_acao(engine),
-            'dist_periodo': carregar_distribuicao_periodo(engine),
-            'dist_uf': carregar_distribuicao_uf(engine),
-            'dist_inciso': carregar_distribuicao_inciso(engine),
-            'top_grupos': carregar_top_grupos(engine, 100),
-            'lista_grupos': carregar_lista_grupos(engine),
-            'lista_empresas': carregar_lista_empresas(engine)
-        }
+        dados, tempos_carga = carregar_dados_pagina(engine, datasets)
 
     # Info na sidebar
     resumo = dados.get('resumo_geral', {})
@@ -1437,38 +3793,43 @@ def main():
     # Filtros visuais
     filtros = criar_filtros_sidebar()
 
-    # Botao de limpar cache
-    st.sidebar.markdown("---")
-    if st.sidebar.button("Limpar Cache"):
-        st.cache_data.clear()
-        st.cache_resource.clear()
-        st.sidebar.success("Cache limpo!")
-        st.rerun()
+    # Tempos da carga de dados
+    exibir_tempos_carga(tempos_carga)
 
     # Informacoes do sistema
     st.sidebar.markdown("---")
     st.sidebar.markdown("### Informacoes")
     st.sidebar.caption(f"Versao: 6.0")
     st.sidebar.caption(f"Database: {DATABASE}")
+    if BACKEND_DADOS == 'local':
+        st.sidebar.caption(f"Backend: snapshot local {versao_snapshot_local()}")
     st.sidebar.caption(f"Tabela: {TABELA_PRINCIPAL}")
-    st.sidebar.caption(f"Atualizado: {datetime.now().strftime('%d/%m/%Y')}")
+    versao = versao_dados_atual(engine)
+    if versao:
+        st.sidebar.caption(f"Dados processados em: {pd.Timestamp(versao).strftime('%d/%m/%Y %H:%M')}")
 
     # Roteamento
     try:
-        if pagina_selecionada == "Dashboard Executivo":
-            dashboard_executivo(dados, filtros)
-        elif pagina_selecionada == "Ranking de Grupos":
-            ranking_grupos(dados, filtros)
-        elif pagina_selecionada == "Analise de Grupo":
-            analise_detalhada_grupo(dados, filtros, engine)
-        elif pagina_selecionada == "Analise de Empresa":
-            analise_detalhada_empresa(dados, filtros, engine)
-        elif pagina_selecionada == "Relatorio Executivo":
-            relatorio_executivo(dados, filtros)
+        if pagina['usa_engine']:
+            pagina['funcao'](dados, filtros, engine)
+        else:
+            pagina['funcao'](dados, filtros)
     except Exception as e:
         st.error(f"Erro ao carregar pagina: {str(e)}")
         st.exception(e)
 
+    # Execucao completa (autenticacao, conexao, loaders, sidebar e pagina), para
+    # comparar com as reexecucoes isoladas dos fragmentos
+    estatisticas_interacoes().registrar(
+        f"{pagina_selecionada} (execucao completa)", time.perf_counter() - inicio_execucao
+    )
+
+    # Latencia das consultas nomeadas (inclui as executadas pela pagina)
+    exibir_estatisticas_consultas()
+    exibir_estatisticas_figuras()
+    exibir_estatisticas_interacoes()
+    exibir_memoria_caches()
+
     # Rodape
     st.markdown("---")
     st.markdown(
@@ -1484,5 +3845,245 @@ def main():
 # 9. EXECUCAO
 # =============================================================================
 
+# Grupos (maiores creditos) com detalhes carregados pelo pre-aquecimento
+QTD_GRUPOS_PREAQUECIMENTO = 100
+
+def preaquecer_caches(engine, qtd_grupos=QTD_GRUPOS_PREAQUECIMENTO):
+    """Executa os loaders do dashboard para que os primeiros acessos encontrem o cache quente.
+
+    Roda como ultimo passo do pipeline: carrega todos os datasets das paginas,
+    o ranking e a busca de empresas com os filtros padrao e os detalhes dos
+    `qtd_grupos` grupos de maior credito. Os tempos sao exibidos e anexados a
+    dados_locais/preaquecimento.csv.
+    """
+    if cache_disco() is None:
+        print("Aviso: cache em disco desativado; apenas o banco sera aquecido.")
+
+    versao = versao_dados_atual(engine)
+    tempos = []
+
+    def medir(etapa, funcao, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = funcao(*args, **kwargs)
+        tempos.append((etapa, time.perf_counter() - inicio))
+        return resultado
+
+    inicio_total = time.perf_counter()
+
+    # Datasets das paginas (mesmas chaves de cache usadas pelo dashboard)
+    _, tempos_carga = carregar_dados_pagina(engine, list(DATASETS))
+    tempos.extend((nome, segundos) for nome, segundos in tempos_carga.items() if nome != '_total')
+    medir('ranking_grupos', carregar_ranking_grupos, engine, acoes=('EXCLUSAO_COM_DEBITO',))
+    medir('busca_empresas', buscar_empresas, engine)
+
+    # Detalhes dos maiores grupos por credito, em paralelo
+    df_top = carregar_top_grupos(engine, qtd_grupos)
+    with ThreadPoolExecutor(max_workers=MAX_CONSULTAS_PARALELAS) as executor:
+        list(executor.map(
+            lambda num_grupo: medir(
+                f"detalhes_grupo {num_grupo}",
+                carregar_detalhes_grupo, engine, num_grupo, COLUNAS_ANALISE_GRUPO
+            ),
+            df_top['num_grupo'].tolist()
+        ))
+    tempo_total = time.perf_counter() - inicio_total
+
+    df_tempos = pd.DataFrame(tempos, columns=['etapa', 'segundos'])
+    detalhes = df_tempos[df_tempos['etapa'].str.startswith('detalhes_grupo')]
+    for etapa, segundos in df_tempos.drop(detalhes.index).itertuples(index=False):
+        print(f"{etapa:<20} {segundos:8.2f}s")
+    if not detalhes.empty:
+        print(
+            f"{'detalhes_grupo':<20} {detalhes['segundos'].sum():8.2f}s "
+            f"(soma de {len(detalhes)} grupos, media {detalhes['segundos'].mean():.2f}s, "
+            f"p95 {detalhes['segundos'].quantile(0.95):.2f}s)"
+        )
+    print(f"{'total':<20} {tempo_total:8.2f}s (versao {versao})")
+
+    df_tempos.insert(0, 'versao', versao)
+    df_tempos.insert(0, 'data_execucao', datetime.now().isoformat(timespec='seconds'))
+    historico = os.path.join(DIRETORIO_DADOS_LOCAIS, 'preaquecimento.csv')
+    os.makedirs(DIRETORIO_DADOS_LOCAIS, exist_ok=True)
+    df_tempos.to_csv(historico, mode='a', index=False, header=not os.path.exists(historico))
+    return df_tempos
+
+def benchmark_formatacao(linhas=100000):
+    """Compara a formatacao celula a celula (.apply) com a vetorizada em um DataFrame sintetico."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'vl_ct': np.round(rng.lognormal(10, 3, linhas), 2),
+        'cpf': rng.integers(0, 10 ** 11, linhas),
+        'cnpj_raiz': rng.integers(0, 10 ** 8, linhas),
+        'acao': rng.choice(ACOES_FISCAIS, linhas),
+        'tipo_inciso': rng.choice(list(BADGES_INCISO), linhas)
+    })
+    casos = [
+        ('moeda', 'vl_ct', formatar_moeda, formatar_moeda_coluna),
+        ('cpf', 'cpf', formatar_cpf, formatar_cpf_coluna),
+        ('cnpj', 'cnpj_raiz', formatar_cnpj, formatar_cnpj_coluna),
+        ('badge acao', 'acao', criar_badge_acao, criar_badge_acao_coluna),
+        ('badge inciso', 'tipo_inciso', criar_badge_inciso, criar_badge_inciso_coluna)
+    ]
+
+    print(f"Linhas: {linhas:,}")
+    print(f"{'formatador':<14} {'apply (ms)':>11} {'vetorizado (ms)':>16} {'ganho':>7}")
+    for nome, coluna, escalar, vetorizado in casos:
+        inicio = time.perf_counter()
+        esperado = df[coluna].apply(escalar)
+        tempo_apply = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        obtido = vetorizado(df[coluna])
+        tempo_vetorizado = time.perf_counter() - inicio
+
+        if not esperado.equals(obtido.astype(esperado.dtype)):
+            raise AssertionError(f"formatacao vetorizada diverge em '{nome}'")
+        print(
+            f"{nome:<14} {tempo_apply * 1000:11.1f} {tempo_vetorizado * 1000:16.1f} "
+            f"{tempo_apply / tempo_vetorizado:6.1f}x"
+        )
+
+def memoria_residente_mb():
+    """Memoria residente atual do processo em MB (Linux)."""
+    with open('/proc/self/statm') as arquivo:
+        paginas = int(arquivo.read().split()[1])
+    return paginas * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+def benchmark_cache(engine, sessoes=20, reruns=5):
+    """Compara a entrega dos datasets compartilhados: st.cache_data x visao rasa.
+
+    O st.cache_data guarda o resultado serializado e desserializa uma copia a
+    cada acesso; aqui cada sessao simulada mantem os datasets do seu ultimo
+    rerun, como acontece com sessoes simultaneas no servidor.
+    """
+    resumo = carregar_resumo_agregado(engine)
+    datasets = {
+        'top_grupos': carregar_top_grupos(engine, 50),
+        'lista_grupos': carregar_lista_grupos(engine),
+        **{chave: valor for chave, valor in resumo.items() if isinstance(valor, pd.DataFrame)}
+    }
+    serializados = {nome: pickle.dumps(df) for nome, df in datasets.items()}
+    tamanho = sum(df.memory_usage(deep=True).sum() for df in datasets.values()) / 1024 ** 2
+    print(f"Datasets: {', '.join(datasets)} ({tamanho:.1f} MB)")
+    print(f"Sessoes simultaneas: {sessoes} | reruns por sessao: {reruns}")
+
+    modos = {
+        'st.cache_data (copia)': lambda nome: pickle.loads(serializados[nome]),
+        'compartilhado (visao rasa)': lambda nome: visao_somente_leitura(datasets[nome])
+    }
+    for modo, entregar in modos.items():
+        gc.collect()
+        memoria_inicial = memoria_residente_mb()
+        dados_sessoes = [None] * sessoes
+
+        inicio = time.perf_counter()
+        for _ in range(reruns):
+            for sessao in range(sessoes):
+                dados_sessoes[sessao] = {nome: entregar(nome) for nome in datasets}
+        por_rerun = (time.perf_counter() - inicio) / (sessoes * reruns)
+
+        memoria_sessoes = memoria_residente_mb() - memoria_inicial
+        del dados_sessoes
+        print(
+            f"{modo:<28} {por_rerun * 1000:8.3f} ms por rerun | "
+            f"+{memoria_sessoes:8.1f} MB residentes com {sessoes} sessoes"
+        )
+
+def executar_cli(argumentos):
+    """Comandos de manutencao executados fora do Streamlit."""
+    parser = argparse.ArgumentParser(
+        prog="python BCADASTRO_V6.py",
+        description="Sistema GENESIS V6 - tarefas de manutencao"
+    )
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    comandos.add_parser(
+        'sincronizar',
+        help="Atualiza o snapshot Parquet local das tabelas V6 a partir do Impala"
+    )
+    preaquecer = comandos.add_parser(
+        'preaquecer',
+        help="Carrega os caches do dashboard (executar ao final do pipeline)"
+    )
+    preaquecer.add_argument('--grupos', type=int, default=QTD_GRUPOS_PREAQUECIMENTO)
+    benchmark = comandos.add_parser(
+        'benchmark-cache',
+        help="Mede o custo por rerun e a memoria das copias do cache com sessoes simultaneas"
+    )
+    benchmark.add_argument('--sessoes', type=int, default=20)
+    benchmark.add_argument('--reruns', type=int, default=5)
+    formatacao = comandos.add_parser(
+        'benchmark-formatacao',
+        help="Mede a formatacao vetorizada de moeda, CPF, CNPJ e badges contra o .apply"
+    )
+    formatacao.add_argument('--linhas', type=int, default=100000)
+    exportar = comandos.add_parser(
+        'exportar',
+        help=f"Exporta {TABELA_PRINCIPAL} filtrada por UF, acao e periodo, em lotes"
+    )
+    exportar.add_argument('saida', help="Arquivo de destino")
+    exportar.add_argument('--formato', choices=list(FORMATOS_EXPORTACAO), default='csv')
+    exportar.add_argument('--uf', action='append', default=[], help="Pode ser repetido")
+    exportar.add_argument('--acao', action='append', default=[], choices=ACOES_FISCAIS, help="Pode ser repetido")
+    exportar.add_argument('--ano-inicial', type=int)
+    exportar.add_argument('--ano-final', type=int)
+    dossies = comandos.add_parser(
+        'dossies',
+        help="Gera o ZIP com os dossies dos grupos EXCLUSAO_COM_DEBITO"
+    )
+    dossies.add_argument(
+        'saida', nargs='?',
+        help="Arquivo ZIP de destino; se omitido, um novo ZIP em DIRETORIO_DOSSIES (listado na pagina Administracao)"
+    )
+    dossies.add_argument('--limite', type=int, help="Maximo de grupos (maiores creditos); todos se omitido")
+    dossies.add_argument('--min-credito', type=float, default=0)
+    args = parser.parse_args(argumentos)
+
+    if args.comando == 'sincronizar':
+        if not ESPELHO_LOCAL_DISPONIVEL:
+            parser.error("o snapshot local requer os pacotes duckdb, duckdb_engine e pyarrow")
+        sincronizar_snapshot_local(get_impala_engine())
+    elif args.comando == 'preaquecer':
+        preaquecer_caches(get_engine_dados(), args.grupos)
+    elif args.comando == 'benchmark-formatacao':
+        benchmark_formatacao(args.linhas)
+    elif args.comando == 'benchmark-cache':
+        benchmark_cache(get_engine_dados(), args.sessoes, args.reruns)
+    elif args.comando == 'exportar':
+        if args.formato == 'parquet' and not PARQUET_DISPONIVEL:
+            parser.error("a exportacao em Parquet requer o pacote pyarrow")
+        inicio = time.perf_counter()
+        caminho, linhas = exportar_tabela_principal(
+            get_engine_dados(),
+            args.formato,
+            progresso=lambda linhas: print(f"{linhas:,} linhas", end='\r'),
+            ufs=args.uf,
+            acoes=args.acao,
+            ano_inicial=args.ano_inicial,
+            ano_final=args.ano_final
+        )
+        shutil.move(caminho, args.saida)
+        segundos = time.perf_counter() - inicio
+        print(f"{linhas:,} linhas gravadas em {args.saida} ({segundos:.1f}s, {linhas / max(segundos, 1e-9):,.0f} linhas/s)")
+    elif args.comando == 'dossies':
+        engine = get_engine_dados()
+        inicio = time.perf_counter()
+        grupos = listar_grupos_dossie(engine, args.limite, args.min_credito)
+        print(f"{len(grupos):,} grupos EXCLUSAO_COM_DEBITO ({PROCESSOS_DOSSIES} processos)")
+        caminho, qtd_grupos = gerar_dossies(
+            engine,
+            grupos,
+            progresso=lambda concluidos, total: print(f"{concluidos:,} de {total:,} grupos", end='\r')
+        )
+        saida = args.saida or os.path.join(DIRETORIO_DOSSIES, f"dossies_{datetime.now():%Y%m%d_%H%M%S}.zip")
+        os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+        # Troca atomica: a pagina nunca lista um ZIP incompleto
+        shutil.move(caminho, saida + '.tmp')
+        os.replace(saida + '.tmp', saida)
+        segundos = time.perf_counter() - inicio
+        print(f"{qtd_grupos:,} dossies gravados em {saida} ({segundos:.1f}s, {qtd_grupos / max(segundos, 1e-9):,.1f} grupos/s)")
+
 if __name__ == "__main__":
-    main()
+    if EXECUCAO_STREAMLIT:
+        main()
+    else:
+        executar_cli(sys.argv[1:])
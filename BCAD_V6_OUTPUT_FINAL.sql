@@ -405,3 +405,108 @@ SELECT
 FROM gessimples.bcad_v6_output_final
 ORDER BY vl_ct DESC
 LIMIT 20;
+
+-- ============================================================================
+-- PARTE 9: RESUMO AGREGADO (Dashboard Executivo em uma unica leitura)
+-- Todos os agregados do dashboard (geral, por acao, periodo, UF e inciso)
+-- calculados em uma unica varredura via GROUPING SETS (Impala 4.x).
+-- A coluna DIMENSAO identifica o conjunto; VALOR traz o valor da dimensao.
+-- ============================================================================
+
+DROP TABLE IF EXISTS gessimples.bcad_v6_resumo_agregado;
+CREATE TABLE gessimples.bcad_v6_resumo_agregado STORED AS PARQUET AS
+SELECT
+    CASE
+        WHEN GROUPING(acao) = 0 THEN 'acao'
+        WHEN GROUPING(flag_periodo) = 0 THEN 'flag_periodo'
+        WHEN GROUPING(uf) = 0 THEN 'uf'
+        WHEN GROUPING(tipo_inciso) = 0 THEN 'tipo_inciso'
+        ELSE 'geral'
+    END AS dimensao,
+    COALESCE(acao, flag_periodo, uf, tipo_inciso) AS valor,
+
+    -- Contagens distintas
+    COUNT(DISTINCT num_grupo) AS qtd_grupos,
+    COUNT(DISTINCT cnpj_raiz) AS qtd_empresas,
+    COUNT(DISTINCT cpf) AS qtd_socios,
+    COUNT(DISTINCT CASE WHEN uf = 'SC' THEN cnpj_raiz END) AS qtd_empresas_sc,
+
+    -- Credito tributario
+    SUM(vl_ct) AS credito_total,
+    AVG(vl_ct) AS credito_medio,
+    MAX(vl_ct) AS credito_maximo,
+
+    -- Receita no fato gerador
+    SUM(receita_pa_fato) AS receita_total,
+    AVG(receita_pa_fato) AS receita_media,
+    MAX(receita_pa_fato) AS receita_maxima,
+
+    -- Contagens de registros por acao/TE
+    CAST(SUM(CASE WHEN emite_te_sc = 'S' THEN 1 ELSE 0 END) AS BIGINT) AS qtd_emite_te_sc,
+    CAST(SUM(CASE WHEN acao = 'EXCLUSAO_COM_DEBITO' THEN 1 ELSE 0 END) AS BIGINT) AS qtd_exclusao_com_debito,
+    CAST(SUM(CASE WHEN acao = 'EXCLUSAO_SEM_DEBITO' THEN 1 ELSE 0 END) AS BIGINT) AS qtd_exclusao_sem_debito,
+    CAST(SUM(CASE WHEN acao = 'SEM_INTERESSE' THEN 1 ELSE 0 END) AS BIGINT) AS qtd_sem_interesse,
+
+    MAX(dt_processamento) AS dt_processamento
+
+FROM gessimples.bcad_v6_output_final
+GROUP BY GROUPING SETS (
+    (),
+    (acao),
+    (flag_periodo),
+    (uf),
+    (tipo_inciso)
+);
+
+COMPUTE STATS gessimples.bcad_v6_resumo_agregado;
+
+-- ============================================================================
+-- PARTE 10: RESUMO POR GRUPO (Ranking, lista de grupos e KPIs do dashboard)
+-- Uma linha por grupo/socio, ordenada por VL_CT_TOTAL, para que o dashboard
+-- leia poucos milhares de linhas em vez de agregar a tabela de detalhe.
+-- Deve ser a ultima tabela gravada: o dashboard usa o MAX(dt_processamento)
+-- desta tabela como versao dos dados.
+-- ============================================================================
+
+DROP TABLE IF EXISTS gessimples.bcad_v6_grupo_resumo;
+CREATE TABLE gessimples.bcad_v6_grupo_resumo
+SORT BY (vl_ct_total)
+STORED AS PARQUET AS
+SELECT
+    num_grupo,
+    cpf,
+    qte_cnpj,
+    qte_socio,
+
+    -- Valores do grupo
+    SUM(vl_ct) AS vl_ct_total,
+    MAX(receita_pa_fato) AS receita_maxima,
+
+    -- Acao mais grave entre as empresas do grupo
+    CASE
+        WHEN SUM(CASE WHEN acao = 'EXCLUSAO_COM_DEBITO' THEN 1 ELSE 0 END) > 0
+            THEN 'EXCLUSAO_COM_DEBITO'
+        WHEN SUM(CASE WHEN acao = 'EXCLUSAO_SEM_DEBITO' THEN 1 ELSE 0 END) > 0
+            THEN 'EXCLUSAO_SEM_DEBITO'
+        ELSE 'SEM_INTERESSE'
+    END AS acao_principal,
+    MAX(flag_periodo) AS periodo_principal,
+
+    -- Empresas
+    COUNT(DISTINCT cnpj_raiz) AS empresas_grupo,
+    COUNT(DISTINCT CASE WHEN uf = 'SC' THEN cnpj_raiz END) AS empresas_sc,
+    COUNT(DISTINCT CASE WHEN emite_te_sc = 'S' THEN cnpj_raiz END) AS te_emitir,
+
+    -- Classificacao (LC 123/2006)
+    MAX(tipo_inciso) AS tipo_inciso,
+    MAX(situacao_limite) AS situacao_limite,
+
+    -- Posicao no ranking geral por credito
+    ROW_NUMBER() OVER (ORDER BY SUM(vl_ct) DESC, num_grupo) AS posicao_ranking,
+
+    MAX(dt_processamento) AS dt_processamento
+
+FROM gessimples.bcad_v6_output_final
+GROUP BY num_grupo, cpf, qte_cnpj, qte_socio;
+
+COMPUTE STATS gessimples.bcad_v6_grupo_resumo;